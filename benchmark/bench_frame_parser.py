@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Compare `feeder.load_data.read_pose_keypoints` with a full `json.load` on
+realistic OpenPose BODY_25 frames (pose, face and both hands, 3D arrays
+empty), as written by `--write_json`.
+
+    python benchmark/bench_frame_parser.py --num_frame 2000 --num_person 2
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+import common # puts the repository root on sys.path
+from feeder.load_data import read_pose_keypoints
+
+
+def random_keypoints(num_joint):
+    keypoints = []
+    for _ in range(num_joint):
+        keypoints += [round(random.uniform(0, 1920), 3),
+                      round(random.uniform(0, 1080), 3),
+                      round(random.random(), 6)]
+    return keypoints
+
+
+def write_frames(folder, num_frame, num_person):
+    paths = []
+    for t in range(num_frame):
+        people = [dict(person_id=[-1],
+                       pose_keypoints_2d=random_keypoints(25),
+                       face_keypoints_2d=random_keypoints(70),
+                       hand_left_keypoints_2d=random_keypoints(21),
+                       hand_right_keypoints_2d=random_keypoints(21),
+                       pose_keypoints_3d=[],
+                       face_keypoints_3d=[],
+                       hand_left_keypoints_3d=[],
+                       hand_right_keypoints_3d=[])
+                  for _ in range(num_person)]
+        path = os.path.join(folder, 'video_{:012d}_keypoints.json'.format(t))
+        with open(path, 'w') as f:
+            json.dump(dict(version=1.3, people=people), f)
+        paths.append(path)
+    return paths
+
+
+def json_load(path):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return np.array(data['people'][0]['pose_keypoints_2d']).reshape(-1, 3)[:, :2]
+
+
+def bench(fn, paths, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            fn(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenPose frame parser benchmark')
+    parser.add_argument('--num_frame', type=int, default=2000)
+    parser.add_argument('--num_person', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    arg = parser.parse_args()
+
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_frames(folder, arg.num_frame, arg.num_person)
+        size = sum(os.path.getsize(p) for p in paths) / len(paths)
+
+        for path in paths:
+            assert np.array_equal(json_load(path), read_pose_keypoints(path))
+
+        print('{} frames, {} person(s), {:.1f} KB per frame'.format(
+            arg.num_frame, arg.num_person, size / 1024))
+        base = bench(json_load, paths, arg.repeat)
+        fast = bench(read_pose_keypoints, paths, arg.repeat)
+        print('\tjson.load            {:8.1f} frames/s'.format(arg.num_frame / base))
+        print('\tread_pose_keypoints  {:8.1f} frames/s  x{:.2f}'.format(
+            arg.num_frame / fast, base / fast))
+
+
+if __name__ == '__main__':
+    main()
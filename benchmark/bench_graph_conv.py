@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Compare the einsum graph convolution of `net.utils.tgcn.ConvTemporalGraphical`
+with its fused batched matmul path, layer by layer of `net.st_gcn.Model`.
+
+    python benchmark/bench_graph_conv.py --batch_size 8 --num_frame 700 --threads 1
+"""
+import argparse
+
+import torch
+
+from common import timeit
+from net.st_gcn import Model
+
+
+def einsum_forward(gcn, x, A):
+    """ The graph convolution before the fused path """
+    x = gcn.conv(x)
+    n, kc, t, v = x.size()
+    x = x.view(n, gcn.kernel_size, kc//gcn.kernel_size, t, v)
+    x = torch.einsum('nkctv,kvw->nctw', (x, A))
+    return x.contiguous(), A
+
+
+def main():
+    parser = argparse.ArgumentParser(description='graph convolution benchmark')
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--num_frame', type=int, default=700)
+    parser.add_argument('--layout', default='body25')
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    arg = parser.parse_args()
+    if arg.threads > 0:
+        torch.set_num_threads(arg.threads)
+
+    model = Model(2, 3, dict(layout=arg.layout, strategy='spatial'), True).eval()
+    V = model.A.size(1)
+    print('batch of {}, T={}, V={}, K={}, {} threads'.format(
+        arg.batch_size, arg.num_frame, V, model.A.size(0), torch.get_num_threads()))
+
+    x = torch.randn(arg.batch_size, 2, arg.num_frame, V)
+    total_einsum = total_fused = 0
+    with torch.no_grad():
+        for i, (block, A) in enumerate(zip(model.st_gcn_networks, model.adjacency())):
+            gcn = block.gcn
+            t_einsum = timeit(lambda: einsum_forward(gcn, x, A), arg.repeat)
+            t_fused = timeit(lambda: gcn(x, A), arg.repeat)
+            assert torch.allclose(einsum_forward(gcn, x, A)[0], gcn(x, A)[0],
+                                  rtol=1e-4, atol=1e-4)
+            print('\tlayer {} {:>14} einsum {:8.2f} ms  fused {:8.2f} ms  x{:.1f}'.format(
+                i, str(tuple(x.shape[1:3])), t_einsum * 1e3, t_fused * 1e3,
+                t_einsum / t_fused))
+            total_einsum += t_einsum
+            total_fused += t_fused
+            x, _ = block(x, A)
+    print('\ttotal {:>22} {:8.2f} ms  fused {:8.2f} ms  x{:.1f}'.format(
+        'einsum', total_einsum * 1e3, total_fused * 1e3, total_einsum / total_fused))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Compare the CPU latency of `net.st_gcn.Model` in eval mode with the copy
+returned by its `optimize_for_inference`. A short batch of one, which leaves
+a single frame after the strided blocks, is checked first and repeatedly so
+the optimized copy does not alter its own buffers.
+
+    python benchmark/bench_inference.py --batch_size 1 8 --num_frame 700 --threads 4
+"""
+import argparse
+
+import torch
+
+from common import timeit
+from net.st_gcn import Model
+
+
+def main():
+    parser = argparse.ArgumentParser(description='inference latency benchmark')
+    parser.add_argument('--batch_size', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--num_frame', type=int, default=700)
+    parser.add_argument('--short_frame', type=int, default=3)
+    parser.add_argument('--layout', default='body25')
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    arg = parser.parse_args()
+    if arg.threads > 0:
+        torch.set_num_threads(arg.threads)
+
+    model = Model(2, 3, dict(layout=arg.layout, strategy='spatial'), True,
+                  dropout=0.5).eval()
+    optimized = model.optimize_for_inference()
+    V = model.A.size(1)
+    print('T={}, V={}, {} threads'.format(arg.num_frame, V, torch.get_num_threads()))
+
+    with torch.no_grad():
+        x = torch.randn(1, 2, arg.short_frame, V, 1)
+        for _ in range(3):
+            assert torch.allclose(model(x), optimized(x), rtol=1e-4, atol=1e-4)
+        print('\tbatch   1  T={} identical over repeated calls'.format(arg.short_frame))
+        for batch_size in arg.batch_size:
+            x = torch.randn(batch_size, 2, arg.num_frame, V, 1)
+            assert torch.allclose(model(x), optimized(x), rtol=1e-4, atol=1e-4)
+            t_eval = timeit(lambda: model(x), arg.repeat)
+            t_optimized = timeit(lambda: optimized(x), arg.repeat)
+            print('\tbatch {:3d}  eval {:8.2f} ms  optimized {:8.2f} ms  x{:.2f}'.format(
+                batch_size, t_eval * 1e3, t_optimized * 1e3, t_eval / t_optimized))
+
+
+if __name__ == '__main__':
+    main()
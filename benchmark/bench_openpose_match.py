@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Check `feeder.tools.openpose_match` against its former per-frame loop on
+randomised inputs, then compare their speed on one long sequence. The exit
+status is 1 if any output differs.
+
+    python benchmark/bench_openpose_match.py --num_case 300 --num_frame 700 --num_person 5
+"""
+import sys
+import argparse
+
+import numpy as np
+
+from common import timeit
+from feeder import tools
+
+
+def openpose_match_loop(data_numpy):
+    """ The former implementation, the reference of the randomised check """
+    C, T, V, M = data_numpy.shape
+    assert (C == 3)
+    score = data_numpy[2, :, :, :].sum(axis=1)
+    # the rank of body confidence in each frame (shape: T-1, M)
+    rank = (-score[0:T - 1]).argsort(axis=1).reshape(T - 1, M)
+
+    # data of frame 1
+    xy1 = data_numpy[0:2, 0:T - 1, :, :].reshape(2, T - 1, V, M, 1)
+    # data of frame 2
+    xy2 = data_numpy[0:2, 1:T, :, :].reshape(2, T - 1, V, 1, M)
+    # square of distance between frame 1&2 (shape: T-1, M, M)
+    distance = ((xy2 - xy1)**2).sum(axis=2).sum(axis=0)
+
+    # match pose
+    forward_map = np.zeros((T, M), dtype=int) - 1
+    forward_map[0] = range(M)
+    for m in range(M):
+        choose = (rank == m)
+        forward = distance[choose].argmin(axis=1)
+        for t in range(T - 1):
+            distance[t, :, forward[t]] = np.inf
+        forward_map[1:][choose] = forward
+    assert (np.all(forward_map >= 0))
+
+    # string data
+    for t in range(T - 1):
+        forward_map[t + 1] = forward_map[t + 1][forward_map[t]]
+
+    # generate data
+    new_data_numpy = np.zeros(data_numpy.shape)
+    for t in range(T):
+        new_data_numpy[:, t, :, :] = data_numpy[:, t, :, forward_map[
+            t]].transpose(1, 2, 0)
+    data_numpy = new_data_numpy
+
+    # score sort
+    trace_score = data_numpy[2, :, :, :].sum(axis=1).sum(axis=0)
+    rank = (-trace_score).argsort()
+    data_numpy = data_numpy[:, :, :, rank]
+
+    return data_numpy
+
+
+def random_case(random_state, num_frame, num_joint, num_person):
+    """ A (3, T, V, M) sequence with absent people and tied confidences """
+    data = random_state.rand(3, num_frame, num_joint, num_person)
+    # people missing in some frames
+    absent = random_state.rand(num_frame, num_person) < 0.2
+    data *= ~absent[:, None, :]
+    # confidences on a coarse grid, so the scores of people often tie
+    if random_state.rand() < 0.5:
+        data[2] = np.round(data[2], 1)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='openpose_match check and benchmark')
+    parser.add_argument('--num_case', type=int, default=300)
+    parser.add_argument('--num_frame', type=int, default=700)
+    parser.add_argument('--num_joint', type=int, default=25)
+    parser.add_argument('--num_person', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    arg = parser.parse_args()
+
+    random_state = np.random.RandomState(arg.seed)
+    num_mismatch = 0
+    for i in range(arg.num_case):
+        T = random_state.randint(1, 60)
+        M = random_state.randint(1, 6)
+        data = random_case(random_state, T, arg.num_joint, M)
+        if not np.array_equal(tools.openpose_match(data.copy()),
+                              openpose_match_loop(data.copy())):
+            num_mismatch += 1
+            print('\tcase {} differs, T={}, M={}'.format(i, T, M))
+    print('{} of {} random cases identical to the loop'.format(
+        arg.num_case - num_mismatch, arg.num_case))
+
+    data = random_case(random_state, arg.num_frame, arg.num_joint, arg.num_person)
+    t_loop = timeit(lambda: openpose_match_loop(data.copy()), arg.repeat)
+    t_match = timeit(lambda: tools.openpose_match(data.copy()), arg.repeat)
+    print('shape {}'.format(data.shape))
+    print('\tloop            {:8.2f} ms'.format(t_loop * 1e3))
+    print('\topenpose_match  {:8.2f} ms  x{:.1f}'.format(t_match * 1e3, t_loop / t_match))
+    return 1 if num_mismatch else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Compare the per-sample, per-frame loop of `feeder.tools.random_move` with
+the batched `feeder.tools.random_move_batch` on one mini-batch.
+
+    python benchmark/bench_random_move.py --batch_size 32 --num_frame 700 --device cuda
+"""
+import argparse
+
+import numpy as np
+import torch
+
+from common import timeit
+from feeder import tools
+
+
+def main():
+    parser = argparse.ArgumentParser(description='random_move benchmark')
+    parser.add_argument('--batch_size', type=int, default=32)
+    parser.add_argument('--num_frame', type=int, default=700)
+    parser.add_argument('--num_joint', type=int, default=25)
+    parser.add_argument('--num_person', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--device', default='cpu')
+    arg = parser.parse_args()
+
+    shape = (arg.batch_size, 3, arg.num_frame, arg.num_joint, arg.num_person)
+    data_numpy = np.random.rand(*shape)
+    data = torch.from_numpy(data_numpy).float().to(arg.device)
+    generator = torch.Generator().manual_seed(0)
+
+    def loop():
+        for d in data_numpy:
+            tools.random_move(d.copy())
+
+    def batch():
+        tools.random_move_batch(data, generator=generator)
+
+    t_loop = timeit(loop, arg.repeat)
+    t_batch = timeit(batch, arg.repeat, data.device)
+    print('batch of {}, shape {}'.format(arg.batch_size, shape[1:]))
+    print('\trandom_move loop     {:8.2f} ms'.format(t_loop * 1e3))
+    print('\trandom_move_batch    {:8.2f} ms  x{:.1f} ({})'.format(
+        t_batch * 1e3, t_loop / t_batch, arg.device))
+
+
+if __name__ == '__main__':
+    main()
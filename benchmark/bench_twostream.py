@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Compare the two sequential streams of `net.st_gcn_twostream.Model` with the
+single grouped pass of `net.st_gcn_twostream.SinglePassModel`, for inference
+and for a training step.
+
+    python benchmark/bench_twostream.py --batch_size 8 --num_frame 700 --device cuda
+"""
+import argparse
+
+import torch
+
+from common import timeit
+from net.st_gcn_twostream import Model, SinglePassModel, STREAMS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='two-stream benchmark')
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--num_frame', type=int, default=700)
+    parser.add_argument('--layout', default='body25')
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--device', default='cpu')
+    arg = parser.parse_args()
+    if arg.threads > 0:
+        torch.set_num_threads(arg.threads)
+    device = torch.device(arg.device)
+
+    args = (2, 4, dict(layout=arg.layout, strategy='spatial'), True)
+    sequential = Model(*args).to(device)
+    single = SinglePassModel(*args).to(device)
+    single.load_state_dict(sequential.state_dict())
+    assert all(k.startswith(STREAMS) for k in sequential.state_dict())
+
+    V = single.A.size(1)
+    x = torch.randn(arg.batch_size, 2, arg.num_frame, V, 1, device=device)
+    print('batch of {}, T={}, V={} on {}, {} threads'.format(
+        arg.batch_size, arg.num_frame, V, device, torch.get_num_threads()))
+
+    for model in (sequential, single):
+        model.eval()
+    with torch.no_grad():
+        assert torch.allclose(sequential(x), single(x), rtol=1e-4, atol=1e-4)
+        t_sequential = timeit(lambda: sequential(x), arg.repeat, device)
+        t_single = timeit(lambda: single(x), arg.repeat, device)
+    print('\tinference   sequential {:8.2f} ms  single pass {:8.2f} ms  x{:.2f}'.format(
+        t_sequential * 1e3, t_single * 1e3, t_sequential / t_single))
+
+    for model in (sequential, single):
+        model.train()
+    t_sequential = timeit(lambda: sequential(x).sum().backward(), arg.repeat, device)
+    t_single = timeit(lambda: single(x).sum().backward(), arg.repeat, device)
+    print('\ttrain step  sequential {:8.2f} ms  single pass {:8.2f} ms  x{:.2f}'.format(
+        t_sequential * 1e3, t_single * 1e3, t_sequential / t_single))
+
+
+if __name__ == '__main__':
+    main()
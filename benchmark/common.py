@@ -0,0 +1,29 @@
+"""
+Helpers shared by the benchmark scripts. Importing this module puts the
+repository root on `sys.path`, so the scripts import it before `feeder`
+or `net`:
+
+    from common import timeit
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def timeit(fn, repeat, device=None):
+    """ The mean seconds of `repeat` calls of `fn` after one warm up call,
+    cuda is synchronized after every call if `device` is a cuda device """
+    def run():
+        fn()
+        if getattr(device, 'type', device) == 'cuda':
+            import torch
+            torch.cuda.synchronize()
+    run()
+    start = time.time()
+    for _ in range(repeat):
+        run()
+    return (time.time() - start) / repeat
@@ -0,0 +1,111 @@
+import numpy as np
+import torch
+
+from . import tools
+
+
+class Augmentation():
+    """ Collate function augmenting whole batches of (C, T_i, V, M) samples
+    Arguments:
+        random_shift: If true, move the non-zero frames of every sample to a random
+            position of its sequence
+        random_choose: If true, randomly choose a portion of `window_size` frames of
+            every sequence, shorter ones are zero padded at a random position
+        random_move: If true, perform randomly but continuously changed transformation
+            to the whole batch with `tools.random_move_batch`
+        window_size: The length of the output sequences, if not positive the batch
+            is padded to its longest sample
+        seed: If not None, the seed of the DataLoader generator, which makes the
+            augmentation of every worker deterministic
+        motion: If true, the samples are (2C, T, V, M), the positions then their
+            motion, only the positions are augmented and the motion is recomputed
+            from them with `tools.motion`
+
+    The steps of `tools.random_shift`, `tools.random_choose` and
+    `tools.auto_pading` only decide which frames of a sample land where, so
+    each sample is copied once, straight into the batch tensor, instead of
+    through a new zero array per step. In a DataLoader worker the batch tensor
+    is allocated in shared memory, so it reaches the main process without
+    another copy.
+
+    Every process draws from its own generators, seeded from the seed torch
+    gives to each worker and epoch, so augmentation throughput scales with
+    the number of workers without repeating the same draws.
+    """
+
+    def __init__(self,
+                 random_shift=False,
+                 random_choose=False,
+                 random_move=False,
+                 window_size=-1,
+                 seed=None,
+                 motion=False):
+        if random_choose and window_size <= 0:
+            raise ValueError('random_choose needs a positive window_size')
+        self.random_shift = random_shift
+        self.random_choose = random_choose
+        self.random_move = random_move
+        self.window_size = window_size
+        self.seed = seed
+        self.motion = motion
+        self.process_seed = None
+
+    def reseed(self):
+        info = torch.utils.data.get_worker_info()
+        if info is not None:
+            seed = info.seed
+        elif self.seed is not None:
+            seed = self.seed
+        else:
+            seed = torch.initial_seed()
+        if seed != self.process_seed:
+            self.process_seed = seed
+            self.random_state = np.random.RandomState(seed % 2**32)
+            self.generator = torch.Generator().manual_seed(seed)
+
+    def place(self, data_numpy):
+        """ Return (begin, end, offset, length): the frames [begin, end) of the
+        sample are copied at `offset` of an output of `length` frames """
+        T = data_numpy.shape[1]
+        begin, end, offset, length = 0, T, 0, T
+
+        if self.random_shift:
+            valid_frame = (data_numpy != 0).any(axis=(0, 2, 3))
+            begin = valid_frame.argmax()
+            end = T - valid_frame[::-1].argmax()
+            offset = self.random_state.randint(0, T - (end - begin) + 1)
+
+        size = self.window_size
+        if size <= 0 or length == size:
+            return begin, end, offset, length
+        if length < size:
+            if self.random_choose:
+                offset += self.random_state.randint(0, size - length + 1)
+            return begin, end, offset, size
+
+        # crop the window [start, start + size) of the current sequence
+        start = self.random_state.randint(0, length - size + 1) if self.random_choose else 0
+        skip = max(start - offset, 0)
+        new_end = begin + max(min(end - begin, start + size - offset), skip)
+        return begin + skip, new_end, max(offset - start, 0), size
+
+    def __call__(self, batch):
+        self.reseed()
+        data, label = zip(*batch)
+        C, _, V, M = data[0].shape
+        P = C // 2 if self.motion else C
+        placement = [self.place(d[:P]) for d in data]
+        T = max(p[3] for p in placement)
+
+        data_batch = torch.zeros((len(data), C, T, V, M))
+        if torch.utils.data.get_worker_info() is not None:
+            data_batch.share_memory_()
+        data_numpy = data_batch.numpy()
+        for i, (d, (begin, end, offset, _)) in enumerate(zip(data, placement)):
+            data_numpy[i, :P, offset:offset + end - begin] = d[:P, begin:end]
+
+        if self.random_move:
+            tools.random_move_batch(data_batch, generator=self.generator, inplace=True)
+        if self.motion:
+            tools.motion(data_numpy[:, :P], out=data_numpy[:, P:])
+        return data_batch, torch.as_tensor(np.array(label))
@@ -0,0 +1,206 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# bump this whenever the layout of the cached arrays changes
+CACHE_VERSION = 7
+
+
+def _stat_key(st):
+    return '{}:{}'.format(st.st_size, st.st_mtime_ns)
+
+
+def folder_digest(folder_path):
+    """
+    Digest of one patient folder from its file listing, sizes and mtimes.
+    """
+    h = hashlib.sha1()
+    for f in sorted(os.scandir(folder_path), key=lambda e: e.name):
+        h.update('{}:{}\n'.format(f.name, _stat_key(f.stat())).encode())
+    return h.hexdigest()
+
+
+def folder_digests(json_path):
+    """
+    Return {folder name: digest} of every patient folder of `json_path`.
+    """
+    return {e.name: folder_digest(e.path)
+            for e in sorted(os.scandir(json_path), key=lambda e: e.name)
+            if e.is_dir()}
+
+
+def fingerprint(json_path, csv_path, variant, max_frame=700, digests=None):
+    """
+    Fingerprint of the raw dataset, computed from the folder listings and
+    mtimes only (no file is opened), so it is cheap enough to check on
+    every start.
+
+    Parameters:
+    json_path (str): root directory containing one folder per patient.
+    csv_path (str): path to the ground truth spreadsheet.
+    variant (str): joint selection mode, e.g. 'load_data_low_limb'.
+    max_frame (int): maximum number of frames kept per patient.
+    digests (dict): the `folder_digests` of `json_path`, if already known.
+    """
+    if digests is None:
+        digests = folder_digests(json_path)
+    h = hashlib.sha1()
+    h.update('{}|{}|{}\n'.format(CACHE_VERSION, variant, max_frame).encode())
+    h.update('{}\n'.format(_stat_key(os.stat(csv_path))).encode())
+    for name in sorted(digests):
+        h.update('{}/{}\n'.format(name, digests[name]).encode())
+    return h.hexdigest()
+
+
+def derived_key(key, *params):
+    """
+    Fingerprint of a stage computed from the cache of fingerprint `key`.
+    """
+    h = hashlib.sha1()
+    h.update('{}|{}|{}\n'.format(CACHE_VERSION, key, params).encode())
+    return h.hexdigest()
+
+
+def cache_path(cache_dir, variant, name):
+    return os.path.join(cache_dir, variant, name)
+
+
+def load_meta(cache_dir, variant):
+    """
+    Return the meta data of the cache of `variant`, or None if there is none.
+    """
+    meta_path = cache_path(cache_dir, variant, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        return json.load(f)
+
+
+def load_cache(cache_dir, variant, key, mmap_mode='r'):
+    """
+    Return the dict of cached arrays of `variant` (`data` memory-mapped, the
+    side arrays loaded), or None if there is no cache or it was built from a
+    different fingerprint.
+    """
+    meta = load_meta(cache_dir, variant)
+    if meta is None or meta.get('fingerprint') != key:
+        return None
+    arrays = dict()
+    for name in meta['arrays']:
+        path = cache_path(cache_dir, variant, name + '.npy')
+        arrays[name] = np.load(path, mmap_mode=mmap_mode if name == 'data' else None)
+    return arrays
+
+
+def _save_arrays(cache_dir, variant, arrays):
+    if 'sample_name' in arrays:
+        arrays['sample_name'] = np.asarray(arrays['sample_name'], dtype=str)
+    for name, value in arrays.items():
+        tmp_path = cache_path(cache_dir, variant, name + '.tmp.npy')
+        np.save(tmp_path, np.asarray(value))
+        os.replace(tmp_path, cache_path(cache_dir, variant, name + '.npy'))
+
+
+def _invalidate(cache_dir, variant):
+    meta_path = cache_path(cache_dir, variant, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+
+def _write_meta(cache_dir, variant, key, arrays, shape, folders):
+    with open(cache_path(cache_dir, variant, 'meta.json'), 'w') as f:
+        json.dump(dict(fingerprint=key, version=CACHE_VERSION,
+                       arrays=sorted(arrays), shape=list(shape),
+                       folders=folders), f)
+
+
+def save_cache(cache_dir, variant, key, folders=None, **arrays):
+    """
+    Write the compiled arrays of `variant`, `data` plus any side arrays such
+    as `label`, `sample_name` and `length`. `folders` are the folder digests
+    the arrays were built from, they let `update_cache` find the delta later.
+    The fingerprint is written last, so an interrupted write is never
+    mistaken for a valid cache.
+    """
+    variant_dir = os.path.join(cache_dir, variant)
+    if not os.path.exists(variant_dir):
+        os.makedirs(variant_dir)
+    _invalidate(cache_dir, variant)
+
+    arrays['data'] = np.ascontiguousarray(arrays['data'], dtype=np.float32)
+    _save_arrays(cache_dir, variant, arrays)
+    _write_meta(cache_dir, variant, key, arrays, arrays['data'].shape, folders)
+
+
+def update_cache(cache_dir, variant, key, keep, patch, append, folders=None,
+                 **side_arrays):
+    """
+    Update the cached `data` of `variant` without rewriting unchanged rows
+    from the source.
+
+    Parameters:
+    keep (list): rows of the cached data kept, in their new order.
+    patch (dict): row -> new (C, T, V, M) block, for kept rows that changed.
+    append (np.ndarray): (K, C, T, V, M) new rows appended after `keep`.
+    folders (dict): the folder digests the updated arrays correspond to.
+    side_arrays: the complete side arrays (label, sample_name, ...) in the
+        new row order.
+
+    If no row is added or removed, the changed rows are patched in place
+    through a writable memory map. Otherwise the kept rows are copied row by
+    row into a new file, which then replaces the old one.
+    """
+    _invalidate(cache_dir, variant)
+    data_path = cache_path(cache_dir, variant, 'data.npy')
+    data = np.load(data_path, mmap_mode='r+')
+    keep = list(keep)
+
+    if keep == list(range(len(data))) and len(append) == 0:
+        for row, block in patch.items():
+            data[row] = block
+        data.flush()
+        shape = data.shape
+    else:
+        shape = (len(keep) + len(append),) + data.shape[1:]
+        tmp_path = cache_path(cache_dir, variant, 'data.tmp.npy')
+        new_data = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float32, shape=shape)
+        for i, row in enumerate(keep):
+            new_data[i] = patch[row] if row in patch else data[row]
+        if len(append) > 0:
+            new_data[len(keep):] = append
+        new_data.flush()
+        del new_data
+        os.replace(tmp_path, data_path)
+    del data
+
+    _save_arrays(cache_dir, variant, side_arrays)
+    _write_meta(cache_dir, variant, key, ['data'] + list(side_arrays), shape, folders)
+
+
+def save_derived(cache_dir, variant, key, source, transform, block_size=64,
+                 shape=None):
+    """
+    Write `transform` of the rows of `source` as the cached data of
+    `variant`, `block_size` rows at a time, so neither the source nor the
+    result is ever held in memory as a whole. `shape` is the shape of the
+    result if it differs from the one of `source`.
+    """
+    if shape is None:
+        shape = source.shape
+    variant_dir = os.path.join(cache_dir, variant)
+    if not os.path.exists(variant_dir):
+        os.makedirs(variant_dir)
+    _invalidate(cache_dir, variant)
+
+    tmp_path = cache_path(cache_dir, variant, 'data.tmp.npy')
+    data = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.float32, shape=shape)
+    for begin in range(0, len(source), block_size):
+        data[begin:begin + block_size] = transform(
+            np.asarray(source[begin:begin + block_size]))
+    data.flush()
+    del data
+    os.replace(tmp_path, cache_path(cache_dir, variant, 'data.npy'))
+    _write_meta(cache_dir, variant, key, ['data'], shape, None)
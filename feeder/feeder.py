@@ -4,6 +4,8 @@ import sys
 import numpy as np
 import random
 import pickle
+import json
+import copy
 
 # torch
 import torch
@@ -11,14 +13,18 @@ import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
 from torchvision import datasets, transforms
-from feeder.load_data_low_limb import process_json_files, compare_strings # load the low limb joints of each video
-# from feeder.load_data import process_json_files, compare_strings        # load the whole joints of each video
+from feeder import load_data_low_limb as loader # load the low limb joints of each video
+# from feeder import load_data as loader          # load the whole joints of each video
 import pandas as pd
 # visualization
 import time
 
 # operation
 from . import tools
+from . import cache
+from . import quality
+from .label_index import build_label_index, load_label_index, join_labels
+from .augment import Augmentation
 
 class Feeder(torch.utils.data.Dataset):
     """ Feeder for skeleton-based action recognition
@@ -30,58 +36,314 @@ class Feeder(torch.utils.data.Dataset):
         window_size: The length of the output sequence
         normalization: If true, normalize input sequence
         debug: If true, only use the first 100 samples
+        json_path: the root of the patient folders of openpose json files
+        csv_path: the path to the ground truth level spreadsheet
+        cache_dir: the folder of the compiled skeleton cache
+        use_cache: If true, load the dataset from the cache and rebuild it when stale
+        num_workers: If greater than 0, parse the json files over a process pool of this size
+        split_path: the '.json' manifest of the train/test split, reused when it exists
+        train_ratio: The ratio of each level used for training
+        seed: The random seed of the split of samples missing from the manifest
+        variable_length: If true, return every sample cut to its true length instead of
+            zero padded to 700 frames, batch it with `feeder.sampler.BucketBatchSampler`
+            and `feeder.sampler.pad_collate`
+        num_person_in: The maximum number of people parsed per frame, if greater than 1
+            the patient is selected among them by `feeder.tools.select_person`
+        max_missing: Exclude the patients whose mean ratio of missing joints is larger
+        min_usable_frame: Exclude the patients with fewer frames having every joint detected
+        interpolate_gap: If greater than 0, fill the joints missing for at most this many
+            consecutive frames by `feeder.tools.interpolate_missing`, cached once per
+            version of the dataset
+        random_shift, random_choose, random_move, window_size: The augmentation of the
+            training batches, see `feeder.augment.Augmentation`, used as the collate_fn
+            of the train loader
+        augment_seed: The seed of the augmentation, None for a random one
+        motion: If true, every sample is (2C, T, V, M), the positions then their motion
+            `feeder.tools.motion`, the input of `net.st_gcn_twostream.Model`, cached
+            once per version of the dataset
     """
 
-    def __init__(self, phase):
-                 
-        csv_path = "dataset\GT_Level.xlsx"
-        json_path = "dataset\LA"
-
-        csv = pd.read_excel(csv_path)
-        # csv = pd.read_csv(csv_path)
-
-        # patients = np.zeros( (42, 700, 21) ) # 21 -> (3,7)
-        patients = np.zeros( (42, 700, 25, 2) )
-        # print(f"patients.shape={patients.sh}")
-        level = [] # (44,)
-
-        patients, GT = process_json_files (json_path, patients)
-        patients = np.transpose(patients, (0, 3, 1, 2)) # shape= (42, 3, 700, 25)
-        patients = np.expand_dims(patients, axis=4) # shape= (42, 3, 700, 25, 1)
-        for i in range(GT.shape[0]):
-            for j in range(csv.shape[0]):
-                if compare_strings( GT[i], csv.iloc[j, 0] ):
-                    level = np.append( level, csv.iloc[j, 1] )
-                    break
-
-        df = pd.DataFrame({'index': np.arange(len(level)), 'level': level})
-        train_indices=[]
-        test_indices=[]
-
-        for lvl, group in df.groupby('level'):
-            n_samples = len(group)
-            n_train = int(n_samples * 0.8)
-            shuffled_indices = group.sample(frac=1).index.tolist()
-            train_indices.extend(shuffled_indices[:n_train])
-            test_indices.extend(shuffled_indices[n_train:])
-        train_indices = np.array(train_indices)
-        test_indices = np.array(test_indices)
-
-        patients_train = patients[train_indices]
-        patients_test = patients[test_indices]
-        level_train = level[train_indices]
-        level_test = level[test_indices]
-
-
-        if phase=='train':
-            print(len(level))
-            self.label = level_train
-            self.data  = patients_train
-            print(level_train)
-        elif phase=='test':
-            self.label = level_test
-            self.data = patients_test
+    def __init__(self, phase='train',
+                 json_path=os.path.join('dataset', 'LA'),
+                 csv_path=os.path.join('dataset', 'GT_Level.xlsx'),
+                 cache_dir=os.path.join('dataset', 'cache'),
+                 use_cache=True,
+                 num_workers=0,
+                 split_path=None,
+                 train_ratio=0.8,
+                 seed=None,
+                 variable_length=False,
+                 num_person_in=1,
+                 max_missing=1.0,
+                 min_usable_frame=0,
+                 interpolate_gap=0,
+                 random_shift=False,
+                 random_choose=False,
+                 random_move=False,
+                 window_size=-1,
+                 augment_seed=None,
+                 motion=False):
 
+        dataset = self.load_dataset(json_path, csv_path, cache_dir,
+                                    use_cache, num_workers,
+                                    num_person_in=num_person_in)
+        stage = self.cache_variant(num_person_in)
+        if interpolate_gap > 0:
+            dataset['data'] = self.interpolate_data(
+                dataset, interpolate_gap, cache_dir if use_cache else None,
+                num_person_in)
+            stage += '_interp{}'.format(interpolate_gap)
+        if motion:
+            dataset['data'] = self.motion_data(
+                dataset['data'], stage, cache_dir if use_cache else None)
+
+        # the whole dataset is materialised once, the phases are index views
+        self.full_data = dataset['data']
+        self.full_label = dataset['label']
+        self.full_sample_name = dataset['sample_name']
+        self.full_length = dataset['length']
+        self.variable_length = variable_length
+        self.augmentation = None
+        if random_shift or random_choose or random_move or window_size > 0:
+            self.augmentation = Augmentation(random_shift, random_choose, random_move,
+                                             window_size, augment_seed, motion)
+        self.split_path = split_path
+        self.split = self.load_split(split_path, train_ratio, seed)
+
+        # excluded patients keep their phase in the manifest but are not used
+        keep = quality.check_quality(self.full_sample_name, dataset,
+                                     max_missing, min_usable_frame)
+        self.split = {p: index[keep[index]] for p, index in self.split.items()}
+        self.set_phase(phase)
+
+    def set_phase(self, phase):
+        self.phase = phase
+        self.index = self.split[phase]
+        self.label = self.full_label[self.index]
+        self.sample_name = self.full_sample_name[self.index]
+        self.length = self.full_length[self.index]
+
+    def subset(self, phase):
+        """ Return a view of another phase sharing the loaded arrays """
+        view = copy.copy(self)
+        view.set_phase(phase)
+        return view
+
+    def load_split(self, split_path=None, train_ratio=0.8, seed=None):
+        """ Stratified train/test split by level, persisted as a manifest of
+        sample names. Samples already in the manifest keep their phase, only
+        new samples are split, so reruns never reshuffle the test set """
+
+        names = np.array([os.path.basename(str(n)) for n in self.full_sample_name])
+        manifest = dict(train=[], test=[])
+        if split_path is not None and os.path.exists(split_path):
+            with open(split_path, 'r') as f:
+                manifest = json.load(f)
+        phase_of = {n: phase for phase in ('train', 'test') for n in manifest[phase]}
+
+        new = np.array([i for i, n in enumerate(names) if n not in phase_of], dtype=int)
+        if len(new) > 0:
+            df = pd.DataFrame({'index': new, 'level': self.full_label[new]})
+            for lvl, group in df.groupby('level'):
+                n_samples = len(group)
+                n_train = int(n_samples * train_ratio)
+                shuffled_indices = group['index'].sample(frac=1, random_state=seed).tolist()
+                for i in shuffled_indices[:n_train]:
+                    phase_of[names[i]] = 'train'
+                for i in shuffled_indices[n_train:]:
+                    phase_of[names[i]] = 'test'
+            if split_path is not None:
+                manifest = dict(
+                    train=sorted(n for n, p in phase_of.items() if p == 'train'),
+                    test=sorted(n for n, p in phase_of.items() if p == 'test'))
+                split_dir = os.path.dirname(split_path)
+                if split_dir and not os.path.exists(split_dir):
+                    os.makedirs(split_dir)
+                with open(split_path, 'w') as f:
+                    json.dump(manifest, f, indent=1)
+                print('Split {} new samples, manifest saved to {}.'.format(len(new), split_path))
+
+        return {phase: np.array([i for i, n in enumerate(names)
+                                 if phase_of.get(n) == phase], dtype=int)
+                for phase in ('train', 'test')}
+
+    @staticmethod
+    def cache_variant(num_person_in=1):
+        """ The cache of every joint selection mode and person selection is
+        kept apart, e.g. 'load_data_low_limb' or 'load_data_low_limb_m3' """
+        variant = loader.__name__.split('.')[-1]
+        if num_person_in > 1:
+            variant += '_m{}'.format(num_person_in)
+        return variant
+
+    @staticmethod
+    def load_dataset(json_path, csv_path, cache_dir, use_cache=True,
+                     num_workers=0, rebuild=False, num_person_in=1):
+        """ Return the dict of dataset arrays from the cache. A stale cache is
+        updated incrementally, a missing or incompatible one is rebuilt """
+
+        if not use_cache:
+            return Feeder.build_data(json_path, csv_path, num_workers,
+                                     num_person_in=num_person_in)
+
+        # the joint selection mode is part of the cache key
+        variant = Feeder.cache_variant(num_person_in)
+        digests = cache.folder_digests(json_path)
+        key = cache.fingerprint(json_path, csv_path, variant, digests=digests)
+        dataset = None if rebuild else cache.load_cache(cache_dir, variant, key)
+        if dataset is not None:
+            print('Load {} from cache {}.'.format(variant, os.path.join(cache_dir, variant)))
+            return dataset
+
+        meta = cache.load_meta(cache_dir, variant)
+        if (not rebuild and meta is not None and meta.get('folders') is not None
+                and meta['version'] == cache.CACHE_VERSION):
+            Feeder.update_data(json_path, csv_path, cache_dir, key, digests, meta,
+                               num_person_in)
+        else:
+            print('Cache of {} is missing or incompatible, rebuilding.'.format(variant))
+            cache.save_cache(cache_dir, variant, key, folders=digests,
+                             **Feeder.build_data(json_path, csv_path, num_workers,
+                                                 cache_dir, num_person_in))
+        dataset = cache.load_cache(cache_dir, variant, key)
+        quality.save_report(cache.cache_path(cache_dir, variant, 'quality.csv'),
+                            dataset['sample_name'], dataset['length'], dataset)
+        return dataset
+
+    @staticmethod
+    def interpolate_data(dataset, max_gap, cache_dir=None, num_person_in=1):
+        """ Return the data of `dataset` with the short gaps of missing joints
+        filled. The result is cached as its own variant, under a fingerprint
+        derived from the one of the raw cache and `max_gap` """
+
+        if cache_dir is None:
+            return tools.interpolate_missing(dataset['data'], max_gap)
+
+        variant = Feeder.cache_variant(num_person_in)
+        key = cache.derived_key(cache.load_meta(cache_dir, variant)['fingerprint'],
+                                'interpolate', max_gap)
+        stage = '{}_interp{}'.format(variant, max_gap)
+        interpolated = cache.load_cache(cache_dir, stage, key)
+        if interpolated is None:
+            print('Interpolate gaps of up to {} frames into cache {}.'.format(
+                max_gap, os.path.join(cache_dir, stage)))
+            cache.save_derived(cache_dir, stage, key, dataset['data'],
+                               lambda block: tools.interpolate_missing(block, max_gap))
+            interpolated = cache.load_cache(cache_dir, stage, key)
+        return interpolated['data']
+
+    @staticmethod
+    def motion_data(data, stage, cache_dir=None):
+        """ Return `data` with the motion of every sequence stacked after its
+        positions, (N, 2C, T, V, M). The result is cached as its own variant,
+        under a fingerprint derived from the one of the cache `stage` """
+
+        if cache_dir is None:
+            return tools.stack_motion(data)
+
+        key = cache.derived_key(cache.load_meta(cache_dir, stage)['fingerprint'], 'motion')
+        stacked_stage = '{}_motion'.format(stage)
+        stacked = cache.load_cache(cache_dir, stacked_stage, key)
+        if stacked is None:
+            print('Stack the motion into cache {}.'.format(
+                os.path.join(cache_dir, stacked_stage)))
+            N, C, T, V, M = data.shape
+            cache.save_derived(cache_dir, stacked_stage, key, data, tools.stack_motion,
+                               shape=(N, 2 * C, T, V, M))
+            stacked = cache.load_cache(cache_dir, stacked_stage, key)
+        return stacked['data']
+
+    @staticmethod
+    def update_data(json_path, csv_path, cache_dir, key, digests, meta,
+                    num_person_in=1):
+        """ Parse only the new, changed or newly labelled patient folders and
+        patch them into the cache, removed or unlabelled ones are dropped """
+
+        variant = Feeder.cache_variant(num_person_in)
+        old = cache.load_cache(cache_dir, variant, meta['fingerprint'])
+        row_of = {os.path.basename(str(n)): i for i, n in enumerate(old['sample_name'])}
+        index, ambiguous = load_label_index(csv_path, cache_dir)
+        folders = np.array([os.path.join(json_path, n) for n in sorted(digests)])
+        matched, level = join_labels(folders, index, ambiguous)
+
+        keep, changed, added = [], [], []
+        for i in matched:
+            name = os.path.basename(folders[i])
+            if name not in row_of:
+                added.append(i)
+            else:
+                keep.append(row_of[name])
+                if meta['folders'].get(name) != digests[name]:
+                    changed.append(i)
+        print('Update {}: {} new, {} changed, {} removed, {} unchanged patients.'.format(
+            variant, len(added), len(changed), len(row_of) - len(keep),
+            len(keep) - len(changed)))
+
+        # only the delta is parsed, shape= (K, 2, T, V, 1)
+        _, C, T, V, M = old['data'].shape
+        parsed = np.zeros( (len(changed) + len(added), T, V, C) )
+        length = dict()
+        for k, i in enumerate(changed + added):
+            _, length[i] = loader.load_patient(folders[i], parsed[k], max_frame=T,
+                                               num_person_in=num_person_in)
+        parsed = np.expand_dims(np.transpose(parsed, (0, 3, 1, 2)), axis=4)
+        parsed_quality = quality.joint_quality(
+            parsed, [length[i] for i in changed + added])
+        patch = {row_of[os.path.basename(folders[i])]: parsed[k]
+                 for k, i in enumerate(changed)}
+
+        # kept rows first, in the order of `keep`, then the new rows
+        added_set = set(added)
+        order = [i for i in matched if i not in added_set] + added
+        level_of = dict(zip(matched, level))
+        for i in order:
+            if i not in length:
+                length[i] = old['length'][row_of[os.path.basename(folders[i])]]
+
+        # the quality of unchanged patients is kept from the cache
+        parsed_row = {i: k for k, i in enumerate(changed + added)}
+        side_quality = dict()
+        for name in quality.QUALITY_ARRAYS:
+            side_quality[name] = np.array([
+                parsed_quality[name][parsed_row[i]] if i in parsed_row
+                else old[name][row_of[os.path.basename(folders[i])]]
+                for i in order])
+        cache.update_cache(
+            cache_dir, variant, key, keep, patch, parsed[len(changed):],
+            folders=digests,
+            label=np.array([level_of[i] for i in order]),
+            sample_name=folders[order],
+            length=np.array([length[i] for i in order], dtype=int),
+            **side_quality)
+
+    @staticmethod
+    def build_data(json_path, csv_path, num_workers=0, cache_dir=None,
+                   num_person_in=1):
+        """ Parse the json tree and join it with the ground truth levels,
+        returns a dict of data in (N, C, T, V, M), label, sample_name and
+        length, the number of frames of every patient, and the arrays of
+        `feeder.quality.joint_quality` """
+
+        if cache_dir is None:
+            index, ambiguous = build_label_index(csv_path)
+        else:
+            index, ambiguous = load_label_index(csv_path, cache_dir)
+
+        # patients.shape= (N, 700, V, 2), N is the number of patient folders,
+        # V is 7 for the low limb joints and 25 for the whole joints
+        patients, GT, length = loader.process_json_files (json_path, num_workers=num_workers,
+                                                          return_length=True,
+                                                          num_person_in=num_person_in)
+        patients = np.transpose(patients, (0, 3, 1, 2)) # shape= (N, 2, 700, V)
+        patients = np.expand_dims(patients, axis=4) # shape= (N, 2, 700, V, 1)
+        matched, level = join_labels(GT, index, ambiguous)
+
+        # keep the patients aligned with their levels, the data quality is
+        # computed on the parsed array, without reading the frames again
+        data = patients[matched]
+        return dict(data=data, label=level,
+                    sample_name=GT[matched], length=length[matched],
+                    **quality.joint_quality(data, length[matched]))
 
     def __len__(self):
         return len(self.label)
@@ -91,6 +353,9 @@ class Feeder(torch.utils.data.Dataset):
 
     def __getitem__(self, index):
         # get data
-        data_numpy = np.array(self.data[index])
+        if self.variable_length:
+            data_numpy = np.array(self.full_data[self.index[index], :, :self.length[index]])
+        else:
+            data_numpy = np.array(self.full_data[self.index[index]])
         label = self.label[index]
         return data_numpy, label
@@ -0,0 +1,130 @@
+# sys
+import os
+import json
+import random
+import warnings
+import numpy as np
+
+# torch
+import torch
+
+from torchlight.io import save_h5
+
+with warnings.catch_warnings():
+    warnings.filterwarnings("ignore",category=FutureWarning)
+    import h5py
+
+# bump this whenever the layout of the h5 store changes
+H5_VERSION = 1
+
+
+def export_h5(path, dataset, layout, chunk_frame=64, compression='gzip'):
+    """
+    Write a dataset of `feeder.feeder.Feeder.load_dataset` to one h5 file.
+
+    Every patient is the dataset 'data/<folder name>' of shape (C, T, V, M),
+    cut to its true length and chunked by `chunk_frame` frames, with its
+    label, length and sample name as attributes. The file attributes hold
+    the graph layout and the padded length of the source.
+    """
+    data = dataset['data']
+    N, C, T, V, M = data.shape
+    result, attrs, chunks = dict(), dict(), dict()
+    for i in range(N):
+        name = os.path.basename(str(dataset['sample_name'][i]))
+        length = int(dataset['length'][i])
+        key = 'data/' + name
+        result[key] = np.asarray(data[i, :, :length], dtype=np.float32)
+        chunks[key] = (C, max(1, min(chunk_frame, length)), V, M)
+        attrs[key] = dict(label=float(dataset['label'][i]), length=length,
+                          sample_name=str(dataset['sample_name'][i]))
+    attrs['/'] = dict(layout=layout, max_frame=T, version=H5_VERSION)
+    save_h5(path, result, attrs=attrs, chunks=chunks, compression=compression)
+
+
+class Feeder_h5(torch.utils.data.Dataset):
+    """ Feeder for skeleton-based action recognition from an h5 store of `export_h5`
+    Arguments:
+        data_path: the path to the '.h5' store
+        split_path: the '.json' manifest of the train/test split of `feeder.feeder.Feeder`,
+            if None every patient of the store is used
+        phase: the phase of the manifest to use, 'train' or 'test'
+        random_choose: If true, randomly choose a window of the input sequence,
+            starting at a chunk boundary
+        window_size: The length of the output sequence, only these frames are read
+        joint_range: [begin, end) of the joints to read, if None all joints are read
+        variable_length: If true, return every sample cut to its true length instead
+            of zero padded to `window_size` or to the padded length of the store
+        debug: If true, only use the first 100 samples
+
+    The file is opened lazily in each process, so the feeder can be used by the
+    workers of a DataLoader.
+    """
+
+    def __init__(self,
+                 data_path,
+                 split_path=None,
+                 phase='train',
+                 random_choose=False,
+                 window_size=-1,
+                 joint_range=None,
+                 variable_length=False,
+                 debug=False):
+        self.data_path = data_path
+        self.split_path = split_path
+        self.phase = phase
+        self.random_choose = random_choose
+        self.window_size = window_size
+        self.joint_index = slice(None) if joint_range is None else slice(*joint_range)
+        self.variable_length = variable_length
+        self.debug = debug
+        self.file = None
+
+        self.load_data()
+
+    def load_data(self):
+        names = None
+        if self.split_path is not None:
+            with open(self.split_path, 'r') as f:
+                names = set(json.load(f)[self.phase])
+
+        with h5py.File(self.data_path, 'r') as f:
+            self.max_frame = int(f.attrs['max_frame'])
+            self.layout = f.attrs['layout']
+            self.sample_name = [n for n in sorted(f['data'])
+                                if names is None or n in names]
+            if self.debug:
+                self.sample_name = self.sample_name[0:100]
+            attrs = [f['data'][n].attrs for n in self.sample_name]
+            self.label = np.array([a['label'] for a in attrs])
+            self.length = np.array([a['length'] for a in attrs], dtype=int)
+
+    def __len__(self):
+        return len(self.label)
+
+    def __iter__(self):
+        return self
+
+    def __getitem__(self, index):
+        if self.file is None:
+            self.file = h5py.File(self.data_path, 'r')
+        dset = self.file['data'][self.sample_name[index]]
+        length = self.length[index]
+
+        # only the chosen frames and joints are read
+        begin, end = 0, length
+        if self.window_size > 0:
+            if self.random_choose and length > self.window_size:
+                begin = random.choice(range(0, length - self.window_size + 1,
+                                            dset.chunks[1]))
+            end = min(begin + self.window_size, length)
+        data_numpy = dset[:, begin:end, self.joint_index]
+
+        if not self.variable_length:
+            size = self.window_size if self.window_size > 0 else self.max_frame
+            padded = np.zeros(data_numpy.shape[:1] + (size,) + data_numpy.shape[2:],
+                              dtype=data_numpy.dtype)
+            padded[:, :end - begin] = data_numpy
+            data_numpy = padded
+
+        return data_numpy, self.label[index]
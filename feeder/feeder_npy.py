@@ -0,0 +1,105 @@
+# sys
+import os
+import sys
+import numpy as np
+import random
+import pickle
+
+# torch
+import torch
+
+# operation
+from . import tools
+
+
+class Feeder_npy(torch.utils.data.Dataset):
+    """ Feeder for skeleton-based action recognition from a prepared '.npy' array
+    Arguments:
+        data_path: the path to '.npy' data, the shape of data should be (N, C, T, V, M)
+        label_path: the path to label, a '.pkl' of (sample_name, label) or a '.npy' of labels
+        random_choose: If true, randomly choose a portion of the input sequence
+        random_shift: If true, randomly pad zeros at the begining or end of sequence
+        random_move: If true, perform randomly but continuously changed transformation to input sequence
+        window_size: The length of the output sequence
+        mmap: If true, memory-map the data instead of loading it, so that every
+            worker shares the page cache and datasets larger than RAM can be used
+        debug: If true, only use the first 100 samples
+    """
+
+    def __init__(self,
+                 data_path,
+                 label_path,
+                 random_choose=False,
+                 random_shift=False,
+                 random_move=False,
+                 window_size=-1,
+                 mmap=True,
+                 debug=False):
+        self.debug = debug
+        self.data_path = data_path
+        self.label_path = label_path
+        self.random_choose = random_choose
+        self.random_shift = random_shift
+        self.random_move = random_move
+        self.window_size = window_size
+
+        self.load_data(mmap)
+
+    def load_data(self, mmap=True):
+        # data: N C T V M
+
+        # load label
+        if self.label_path.endswith('.pkl'):
+            with open(self.label_path, 'rb') as f:
+                self.sample_name, self.label = pickle.load(f)
+        else:
+            self.label = np.load(self.label_path)
+            self.sample_name = [str(i) for i in range(len(self.label))]
+
+        # load data, copy-on-write keeps the mapping writable for torch.from_numpy
+        # without ever copying a page that is only read
+        if mmap:
+            self.data = np.load(self.data_path, mmap_mode='c')
+        else:
+            self.data = np.load(self.data_path)
+
+        if self.debug:
+            self.label = self.label[0:100]
+            self.data = self.data[0:100]
+            self.sample_name = self.sample_name[0:100]
+
+        self.N, self.C, self.T, self.V, self.M = self.data.shape
+
+    def __len__(self):
+        return len(self.label)
+
+    def __iter__(self):
+        return self
+
+    def __getitem__(self, index):
+        label = self.label[index]
+
+        # no augmentation: hand out a zero-copy view of the mapped sample
+        if not (self.random_shift or self.random_choose or
+                self.random_move or self.window_size > 0):
+            return torch.from_numpy(self.data[index]), label
+
+        # get data
+        data_numpy = np.array(self.data[index])
+
+        # processing
+        if self.random_shift:
+            data_numpy = tools.random_shift(data_numpy)
+        if self.random_choose:
+            data_numpy = tools.random_choose(data_numpy, self.window_size)
+        elif self.window_size > 0:
+            data_numpy = tools.auto_pading(data_numpy, self.window_size)
+        if self.random_move:
+            data_numpy = tools.random_move(data_numpy)
+
+        return data_numpy, label
+
+    def top_k(self, score, top_k):
+        rank = score.argsort()
+        hit_top_k = [l in rank[i, -top_k:] for i, l in enumerate(self.label)]
+        return sum(hit_top_k) * 1.0 / len(hit_top_k)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+"""
+Ingest the LA dataset into the skeleton cache of `feeder.feeder.Feeder`.
+
+Only new, changed or removed patient folders are parsed and patched into
+the cache, run it after new recordings are copied under dataset/LA:
+
+    python -m feeder.ingest --json_path dataset/LA --csv_path dataset/GT_Level.xlsx
+
+With `--h5` the cached dataset is also exported to a single chunked h5
+store for `feeder.feeder_h5.Feeder_h5`.
+"""
+import os
+import argparse
+
+from .feeder import Feeder, loader
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental LA dataset ingest')
+    parser.add_argument('--json_path', default=os.path.join('dataset', 'LA'), help='the root of the patient folders')
+    parser.add_argument('--csv_path', default=os.path.join('dataset', 'GT_Level.xlsx'), help='the ground truth level spreadsheet')
+    parser.add_argument('--cache_dir', default=os.path.join('dataset', 'cache'), help='the folder of the skeleton cache')
+    parser.add_argument('--num_workers', type=int, default=0, help='the number of processes used by a full rebuild')
+    parser.add_argument('--num_person_in', type=int, default=1, help='the maximum number of people parsed per frame')
+    parser.add_argument('--h5', default=None, help='also export the dataset to this h5 store')
+    parser.add_argument('--chunk_frame', type=int, default=64, help='the number of frames per chunk of the h5 store')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the whole cache instead of updating it')
+    arg = parser.parse_args()
+
+    dataset = Feeder.load_dataset(arg.json_path, arg.csv_path, arg.cache_dir,
+                                  num_workers=arg.num_workers, rebuild=arg.rebuild,
+                                  num_person_in=arg.num_person_in)
+    print('{} patients, data shape {}.'.format(len(dataset['label']), dataset['data'].shape))
+
+    if arg.h5 is not None:
+        from .feeder_h5 import export_h5
+        export_h5(arg.h5, dataset, loader.LAYOUT, arg.chunk_frame)
+        print('Exported to {} ({:.1f} MB).'.format(arg.h5, os.path.getsize(arg.h5) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
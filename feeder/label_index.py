@@ -0,0 +1,90 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+from .load_data import extract_info
+
+
+def build_label_index(csv_path):
+    """
+    Read the ground truth spreadsheet once and index its levels by the
+    parsed (date, suffix) key of the first column.
+
+    Returns:
+    index (dict): (date, suffix) -> level of the first row with that key,
+        the same row the former nested compare_strings scan picked.
+    ambiguous (dict): (date, suffix) -> all levels, for keys that appear in
+        several rows with different levels.
+    """
+    csv = pd.read_excel(csv_path)
+    # csv = pd.read_csv(csv_path)
+
+    index = dict()
+    levels = dict()
+    for name, level in zip(csv.iloc[:, 0], csv.iloc[:, 1]):
+        key = extract_info(str(name))
+        if key == (None, None):
+            continue
+        index.setdefault(key, level)
+        levels.setdefault(key, []).append(level)
+    ambiguous = {k: v for k, v in levels.items() if len(set(v)) > 1}
+    return index, ambiguous
+
+
+def load_label_index(csv_path, cache_dir):
+    """
+    Return (index, ambiguous) of `build_label_index`, cached as a pickle in
+    `cache_dir` and rebuilt whenever the spreadsheet size or mtime changes.
+    """
+    st = os.stat(csv_path)
+    key = (os.path.abspath(csv_path), st.st_size, st.st_mtime_ns)
+    index_path = os.path.join(cache_dir, 'label_index.pkl')
+    if os.path.exists(index_path):
+        with open(index_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['key'] == key:
+            return cached['index'], cached['ambiguous']
+
+    index, ambiguous = build_label_index(csv_path)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    with open(index_path, 'wb') as f:
+        pickle.dump(dict(key=key, index=index, ambiguous=ambiguous), f)
+    return index, ambiguous
+
+
+def join_labels(sample_name, index, ambiguous=None):
+    """
+    Look up the level of every patient folder in `index`.
+
+    Unmatched folders and folders whose key is ambiguous in the
+    spreadsheet are reported together in one summary.
+
+    Returns:
+    matched (np.ndarray): indices into `sample_name` that have a level.
+    level (np.ndarray): the level of each matched folder.
+    """
+    if ambiguous is None:
+        ambiguous = dict()
+    matched, level, unmatched, conflict = [], [], [], []
+    for i, name in enumerate(sample_name):
+        key = extract_info(os.path.basename(str(name)))
+        if key in index:
+            matched.append(i)
+            level.append(index[key])
+            if key in ambiguous:
+                conflict.append(name)
+        else:
+            unmatched.append(name)
+
+    if unmatched or conflict:
+        print('Label join: {} of {} patient folders matched.'.format(
+            len(matched), len(sample_name)))
+        for name in unmatched:
+            print('\tunmatched, dropped: {}'.format(name))
+        for name in conflict:
+            key = extract_info(os.path.basename(str(name)))
+            print('\tambiguous, levels {} in the spreadsheet, kept {}: {}'.format(
+                ambiguous[key], index[key], name))
+    return np.array(matched, dtype=int), np.array(level, dtype=float)
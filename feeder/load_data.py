@@ -1,6 +1,8 @@
 import os
 import re
 import json
+import time
+from multiprocessing import Pool
 # import xlrd
 import numpy as np
 import pandas as pd
@@ -8,6 +10,13 @@ import pandas as pd
 # from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import cv2
 
+from feeder import tools
+
+# openpose BODY_25, see net.utils.graph.Graph(layout='body25')
+LAYOUT = 'body25'
+JOINT_INDEX = slice(None)
+NUM_JOINT = 25
+
 def extract_info(s):
     # 使用正则表达式提取日期和后缀
     match = re.search(r'(\d{8})_([A-Z]+)_\d', s)
@@ -26,51 +35,289 @@ def compare_strings(s1, s2):
     # 比较日期和后缀
     return (date1 == date2) and (suffix1 == suffix2)
 
-def OnePatient (path):
+POSE_KEY = b'"pose_keypoints_2d"'
+
+def read_people_keypoints(path, num_person=1, block_size=4096):
+    """
+    讀出前 `num_person` 個人的 `pose_keypoints_2d` (含信心值), 不解碼
+    hand_*, face_* 與 3D 陣列。
+
+    OpenPose 每個人的 pose 陣列都寫在 face 與 hand 陣列之前, 因此檔案以
+    `block_size` 為單位串流讀取, 讀到第 `num_person` 個 pose 陣列的結尾後
+    就停止讀取, 其餘內容不會被讀入也不會建立任何 Python 物件。
+
+    Parameters:
+    path (str): frame 的 JSON 檔案路徑。
+    num_person (int): 最多讀取的人數。
+    block_size (int): 每次讀取的 byte 數。
+
+    Returns:
+    np.ndarray (m, V, 3), m <= num_person, 若這個 frame 沒有偵測到人則回傳 None。
+    """
+    arrays = []
+    buf = b''
+    pos = 0
+    with open(path, 'rb') as json_file:
+        while len(arrays) < num_person:
+            key_at = buf.find(POSE_KEY, pos)
+            begin = buf.find(b'[', key_at + len(POSE_KEY)) if key_at >= 0 else -1
+            end = buf.find(b']', begin) if begin >= 0 else -1
+            if end >= 0:
+                arrays.append(buf[begin + 1:end])
+                pos = end + 1
+                continue
+            block = json_file.read(block_size)
+            if not block:
+                if key_at >= 0:
+                    raise ValueError('Unterminated pose_keypoints_2d in {}'.format(path))
+                break
+            buf += block
+
+    # 空的 pose 陣列 (沒有偵測到關節) 不算一個人
+    people = [np.array(values.split(b','), dtype=float).reshape(-1, 3)
+              for values in arrays if values.strip()]
+    if not people:
+        return None
+    return np.stack(people)
+
+def read_pose_keypoints(path, with_confidence=False, block_size=4096):
+    """
+    只讀出第一個人的 `pose_keypoints_2d`, 見 `read_people_keypoints`。
+
+    Parameters:
+    path (str): frame 的 JSON 檔案路徑。
+    with_confidence (bool): 若為 True 回傳 (V, 3) 含信心值, 否則回傳 (V, 2)。
+    block_size (int): 每次讀取的 byte 數。
+
+    Returns:
+    np.ndarray, 若這個 frame 沒有偵測到人則回傳 None。
+    """
+    people = read_people_keypoints(path, 1, block_size)
+    if people is None:
+        return None
+    keypoints = people[0]
+    return keypoints if with_confidence else keypoints[:, :2]
+
+def OnePatient (path, out=None):
+    """
+    讀取一個 frame 的 JSON 檔案, 回傳 (1, 25, 2) 的關節座標。
 
-    patient = np.empty( (0, 25, 2) )
+    若給定 `out` (shape (25, 2)), 座標直接寫入 `out`, 不另外配置記憶體。
+    沒有偵測到人時回傳 (0, 25, 2), 由 `load_frames` 計數, 每位病患回報一次。
+    """
+    if out is None:
+        out = np.zeros( (NUM_JOINT, 2) )
+    patient = np.empty( (0,) + out.shape )
     if path.endswith('.json'):
-        file_path = os.path.join(path)
-        with open(file_path, 'r') as json_file:
-            try:
-                # 讀取 JSON 檔案內容
-                data = json.load(json_file)
-                # 在這裡可以對讀取的 JSON 資料進行處理
-                keypoints = np.array(data['people'][0]['pose_keypoints_2d']).reshape(-1, 3)
-                selected_keypoints = keypoints[:, :2]
-                patient = np.append(patient, [selected_keypoints], axis=0)
-                
-            except json.JSONDecodeError as e:
-                print(f"Error reading JSON file {path}: {e}")
+        try:
+            # 只讀取 pose 關節座標
+            keypoints = read_pose_keypoints(path)
+            if keypoints is not None:
+                out[:] = keypoints
+                patient = out[np.newaxis]
+
+        except ValueError as e:
+            print(f"Error reading JSON file {path}: {e}")
 
     return patient
-    
 
-def process_json_files(root_dir, patients):
+
+def load_people(path, out):
+    """
+    讀取一個 frame 中最多 M 個人的關節座標與信心值, 寫入 (3, 25, M) 的 `out`。
+    沒有偵測到人或讀取失敗時 `out` 保持不變。
+    """
+    try:
+        keypoints = read_people_keypoints(path, out.shape[-1])
+    except ValueError as e:
+        print(f"Error reading JSON file {path}: {e}")
+        return out
+    if keypoints is not None:
+        out[:, :, :len(keypoints)] = keypoints.transpose(2, 1, 0)
+    return out
+
+
+def list_frames(folder_path, max_frame=700):
+    """
+    回傳資料夾中依檔名 (即時間) 排序的前 `max_frame` 個 JSON 檔案路徑。
+    """
+    folder_path = str(folder_path) # np.str_ would make os.listdir return bytes
+    json_files = sorted(f for f in os.listdir(folder_path) if f.endswith('.json'))
+    return [os.path.join(folder_path, f) for f in json_files[:max_frame]]
+
+
+def list_patients(root_dir):
+    """
+    回傳根目錄下排序後的病患資料夾路徑。
+    """
+    return [os.path.join(root_dir, folder_name)
+            for folder_name in sorted(os.listdir(root_dir))
+            if os.path.isdir(os.path.join(root_dir, folder_name))]
+
+
+def load_frames(json_file_paths, out, loader=OnePatient, num_person_in=1,
+                joint_index=slice(None)):
+    """
+    逐 frame 讀取 `json_file_paths`, 直接寫入 (T, V, C) 的 `out`。
+
+    `num_person_in` 為 1 時只用 `loader` 讀取每個 frame 的第一個人。大於 1 時
+    每個 frame 讀取最多 `num_person_in` 個人 (含信心值) 到 (3, T, 25, M) 的
+    暫存陣列, 以 `tools.select_person` 選出整段序列中一致的病患, 再依
+    `joint_index` 取出關節寫入 `out`。沒有偵測到人的 frame 保持為 0。
+
+    Returns:
+    沒有偵測到人的 frame 數 (int)
+    """
+    if num_person_in == 1:
+        num_empty = 0
+        for idx, json_file_path in enumerate(json_file_paths):
+            num_empty += len(loader(json_file_path, out=out[idx])) == 0
+        return num_empty
+
+    people = np.zeros( (3, len(json_file_paths), NUM_JOINT, num_person_in) )
+    for idx, json_file_path in enumerate(json_file_paths):
+        load_people(json_file_path, out=people[:, idx])
+    patient = tools.select_person(people)[..., 0]       # 3, T, 25
+    out[:len(json_file_paths)] = patient[0:2, :, joint_index].transpose(1, 2, 0)
+    return int((~people.any(axis=(0, 2, 3))).sum())
+
+
+def report_empty(folder_path, num_empty, num_frame):
+    """
+    一位病患只印出一行沒有偵測到人的 frame 數, 避免每個 frame 各印一行。
+    """
+    if num_empty:
+        print(f"No person detected in {num_empty} of {num_frame} frames of {folder_path}")
+
+
+def load_patient(folder_path, out=None, loader=OnePatient, max_frame=700,
+                 num_joint=NUM_JOINT, num_person_in=1, joint_index=slice(None)):
+    """
+    讀取一個病患資料夾的所有 frame, 逐 frame 直接寫入 (T, V, C) 的 `out`。
+
+    Parameters:
+    folder_path (str): 病患資料夾的路徑。
+    out (np.ndarray): 預先配置的 (T, V, C) 陣列, 若為 None 則依 frame 數配置一次。
+    loader (callable): 單一 frame 的讀取函式, 需支援 `out` 參數。
+    max_frame (int): 最多讀取的 frame 數。
+    num_joint (int): `loader` 輸出的關節數 V。
+    num_person_in (int): 每個 frame 最多讀取的人數, 見 `load_frames`。
+    joint_index (slice): `num_person_in` 大於 1 時保留的 BODY_25 關節。
+
+    Returns:
+    out (np.ndarray), 實際讀取的 frame 數 (int)
+    """
+    if out is not None:
+        max_frame = min(max_frame, len(out))
+    json_file_paths = list_frames(folder_path, max_frame)
+    if out is None:
+        out = np.zeros( (len(json_file_paths), num_joint, 2) )
+    num_empty = load_frames(json_file_paths, out, loader, num_person_in, joint_index)
+    report_empty(folder_path, num_empty, len(json_file_paths))
+    return out, len(json_file_paths)
+
+
+def process_json_files(root_dir, patients=None, num_workers=0, chunk_size=100,
+                       max_frame=700, loader=OnePatient, num_joint=NUM_JOINT,
+                       return_length=False, num_person_in=1,
+                       joint_index=slice(None)):
     """
     從指定的根目錄中遍歷並處理所有JSON檔案。
 
     Parameters:
     root_dir (str): 根目錄的路徑。
+    patients (np.ndarray): 預先配置的 (N, T, V, C) 陣列, 若為 None 則依資料夾數配置。
+    num_workers (int): 大於 0 時以 process pool 平行解析, 見 `process_json_files_parallel`。
+    chunk_size (int): 平行解析時每個 task 的 frame 數。
+    max_frame (int): 每位病患最多讀取的 frame 數。
+    loader (callable): 單一 frame 的讀取函式。
+    num_joint (int): `loader` 輸出的關節數 V。
+    return_length (bool): 若為 True 另外回傳每位病患實際讀取的 frame 數。
+    num_person_in (int): 每個 frame 最多讀取的人數, 見 `load_frames`。
+    joint_index (slice): `num_person_in` 大於 1 時保留的 BODY_25 關節。
     """
-    file_name = []
-    # 遍歷根目錄下的所有資料夾
-    # patients.shape=(42, 700, 25, 2)
-    for folder_name in os.listdir(root_dir):
-        # folder_path = os.path.basename(folder_name)
-        folder_path = os.path.join(root_dir, folder_name)  # 確保 folder_path 包含完整的路徑
-        file_name = np.append (file_name, folder_path)
-        
-        if os.path.isdir(folder_path):
-            # 在每個資料夾中遍歷所有JSON檔案
-            for idx, json_file in enumerate(os.listdir(folder_path)[:700], start=0):
-                if json_file.endswith('.json'):
-                    json_file_path = os.path.join(folder_path, json_file)
-                    patient = OnePatient(json_file_path)
-                    patients[:, idx, :, :] = patient
-        
-        # print(patients[0][0])
-    return patients, file_name
+    if patients is None:
+        patients = np.zeros( (len(list_patients(root_dir)), max_frame, num_joint, 2) )
+    if num_workers > 0:
+        return process_json_files_parallel(root_dir, patients, loader,
+                                           num_workers, chunk_size, max_frame,
+                                           return_length, num_person_in,
+                                           joint_index)
+    # 遍歷根目錄下的所有資料夾, 每位病患只寫入自己的那一列
+    file_name = list_patients(root_dir)
+    length = np.zeros(len(file_name), dtype=int)
+    for idx, folder_path in enumerate(file_name):
+        _, length[idx] = load_patient(folder_path, patients[idx], loader,
+                                      max_frame, num_joint, num_person_in,
+                                      joint_index)
+    if return_length:
+        return patients, np.array(file_name), length
+    return patients, np.array(file_name)
+
+def _parse_chunk(task):
+    """
+    `process_json_files_parallel` 的 worker: 解析同一位病患的一段 frame 檔案,
+    以 (len(chunk), V, C) 的陣列與其中沒有偵測到人的 frame 數回傳。
+    """
+    (patient_idx, start, json_file_paths, loader, num_joint, num_channel,
+     num_person_in, joint_index) = task
+    frames = np.zeros((len(json_file_paths), num_joint, num_channel))
+    num_empty = load_frames(json_file_paths, frames, loader, num_person_in, joint_index)
+    return patient_idx, start, frames, num_empty
+
+def process_json_files_parallel(root_dir, patients, loader=OnePatient,
+                                num_workers=4, chunk_size=100, max_frame=700,
+                                return_length=False, num_person_in=1,
+                                joint_index=slice(None)):
+    """
+    以 process pool 平行解析 `root_dir` 下所有病患資料夾。
+
+    每個病患資料夾的 frame 檔案以 `chunk_size` 個為一段, 每段由一個 worker
+    以 `loader` 解析, 回傳的陣列寫入預先配置的 `patients` 中該病患的那一列。
+    `num_person_in` 大於 1 時需要在整段序列上挑選病患, 因此每位病患只有一個 task。
+
+    Parameters:
+    root_dir (str): 根目錄的路徑, 每位病患一個資料夾。
+    patients (np.ndarray): 預先配置的 (N, T, V, C) 陣列。
+    loader (callable): 模組層級的單一 frame 讀取函式, 例如 `OnePatient`。
+    num_workers (int): worker process 的數量。
+    chunk_size (int): 每個 task 解析的 frame 數。
+    max_frame (int): 每位病患最多讀取的 frame 數。
+    return_length (bool): 若為 True 另外回傳每位病患實際讀取的 frame 數。
+    num_person_in (int): 每個 frame 最多讀取的人數, 見 `load_frames`。
+    joint_index (slice): `num_person_in` 大於 1 時保留的 BODY_25 關節。
+    """
+    _, _, num_joint, num_channel = patients.shape
+    max_frame = min(max_frame, patients.shape[1])
+    if num_person_in > 1:
+        chunk_size = max(max_frame, 1)
+    file_name = list_patients(root_dir)
+    tasks = []
+    length = np.zeros(len(file_name), dtype=int)
+    for patient_idx, folder_path in enumerate(file_name):
+        json_file_paths = list_frames(folder_path, max_frame)
+        length[patient_idx] = len(json_file_paths)
+        for start in range(0, len(json_file_paths), chunk_size):
+            chunk = json_file_paths[start:start + chunk_size]
+            tasks.append((patient_idx, start, chunk, loader,
+                          num_joint, num_channel, num_person_in, joint_index))
+
+    num_frame = sum(len(task[2]) for task in tasks)
+    num_empty = np.zeros(len(file_name), dtype=int)
+    start_time = time.time()
+    with Pool(processes=num_workers) as pool:
+        for patient_idx, start, frames, empty in pool.imap_unordered(_parse_chunk, tasks):
+            patients[patient_idx, start:start + len(frames)] = frames
+            num_empty[patient_idx] += empty
+    for patient_idx, folder_path in enumerate(file_name):
+        report_empty(folder_path, num_empty[patient_idx], length[patient_idx])
+    elapsed = max(time.time() - start_time, 1e-6)
+    print('Parsed {} frames of {} patients in {:.2f}s ({:.1f} frames/s, {} workers)'.format(
+        num_frame, len(file_name), elapsed, num_frame / elapsed, num_workers))
+
+    if return_length:
+        return patients, np.array(file_name), length
+    return patients, np.array(file_name)
 
 # class DataGenerator(tf.keras.utils.Sequence):
 #     def __init__(self, video_paths, labels, batch_size, preprocess_fn):
@@ -8,6 +8,14 @@ import pandas as pd
 # from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import cv2
 
+from feeder import load_data
+
+# the lower limb joints 8 ~ 14 of openpose BODY_25, re-indexed from 0,
+# see net.utils.graph.Graph(layout='body25_lower_limb')
+LAYOUT = 'body25_lower_limb'
+JOINT_INDEX = slice(8, 15)
+NUM_JOINT = 7
+
 def extract_info(s):
     # 使用正则表达式提取日期和后缀
     match = re.search(r'(\d{8})_([A-Z]+)_\d', s)
@@ -26,72 +34,55 @@ def compare_strings(s1, s2):
     # 比较日期和后缀
     return (date1 == date2) and (suffix1 == suffix2)
 
-def OnePatient (path):
+def OnePatient (path, out=None):
+    """
+    讀取一個 frame 的 JSON 檔案, 只保留下肢關節 (8 ~ 14), 回傳 (1, 7, 2)。
 
-    patient = np.empty( (0, 25, 2) )
+    若給定 `out` (shape (7, 2)), 座標直接寫入 `out`, 不另外配置記憶體。
+    沒有偵測到人時回傳 (0, 7, 2), 由 `load_data.load_frames` 計數。
+    """
+    if out is None:
+        out = np.zeros( (NUM_JOINT, 2) )
+    patient = np.empty( (0,) + out.shape )
     if path.endswith('.json'):
-        file_path = os.path.join(path)
-        with open(file_path, 'r') as json_file:
-            try:
-                # 讀取 JSON 檔案內容
-                data = json.load(json_file)
-                # 在這裡可以對讀取的 JSON 資料進行處理
-                keypoints = np.array(data['people'][0]['pose_keypoints_2d']).reshape(-1, 3)
+        try:
+            # 只讀取 pose 關節座標
+            keypoints = load_data.read_pose_keypoints(path)
+            if keypoints is not None:
                 #-- use the entire joints --#
-                # selected_keypoints = keypoints[:, :2]
+                # out[:] = keypoints
 
                 #-- use the low limbs joints from 8 to 15 --#
-                zeroed_keypoints = np.zeros_like(keypoints)
-                zeroed_keypoints[8:15, :2] = keypoints[8:15, :2]  # keep the index range of 8 to 14
+                out[:] = keypoints[JOINT_INDEX]  # keep the index range of 8 to 14
+                patient = out[np.newaxis]
 
-                selected_keypoints = zeroed_keypoints[:, :2]
-                patient = np.append(patient, [selected_keypoints], axis=0)
-                
-            except json.JSONDecodeError as e:
-                print(f"Error reading JSON file {path}: {e}")
+        except ValueError as e:
+            print(f"Error reading JSON file {path}: {e}")
 
     return patient
     
 
-def process_json_files(root_dir, patients):
+def load_patient(folder_path, out=None, max_frame=700, num_person_in=1):
+    """
+    讀取一個病患資料夾的下肢關節, 參數同 `feeder.load_data.load_patient`。
+    """
+    return load_data.load_patient(folder_path, out, OnePatient, max_frame, NUM_JOINT,
+                                  num_person_in, JOINT_INDEX)
+
+
+def process_json_files(root_dir, patients=None, num_workers=0, chunk_size=100,
+                       max_frame=700, return_length=False, num_person_in=1):
     """
-    從指定的根目錄中遍歷並處理所有JSON檔案。
+    從指定的根目錄中遍歷並處理所有JSON檔案, 只保留下肢關節。
 
-    Parameters:
-    root_dir (str): 根目錄的路徑。
+    參數同 `feeder.load_data.process_json_files`。
     """
-    file_name = []
-    # 遍歷根目錄下的所有資料夾
-    patients.shape=(42, 700, 25, 2)
-    for folder_name in os.listdir(root_dir):
-        # folder_path = os.path.basename(folder_name)
-        folder_path = os.path.join(root_dir, folder_name)  # 確保 folder_path 包含完整的路徑
-        file_name = np.append (file_name, folder_path)
-        if os.path.isdir(folder_path):
-            # 在每個資料夾中遍歷所有JSON檔案
-            for idx, json_file in enumerate(os.listdir(folder_path)[:700], start=0):
-                if json_file.endswith('.json'):
-                    json_file_path = os.path.join(folder_path, json_file)
-                    patient = OnePatient(json_file_path)
-                    patients[:, idx, :, :] = patient
-    # debug
-    # log_file_path = os.path.join("./dataset/", 'patient_log.txt')
-    # with open(log_file_path, 'w') as log_file:
-    #     for folder_name in os.listdir(root_dir):
-    #         # folder_path = os.path.basename(folder_name)
-    #         folder_path = os.path.join(root_dir, folder_name)  # 確保 folder_path 包含完整的路徑
-    #         file_name = np.append (file_name, folder_path)
-    #         if os.path.isdir(folder_path):
-    #             # 在每個資料夾中遍歷所有JSON檔案
-    #             for idx, json_file in enumerate(os.listdir(folder_path)[:700], start=0):
-    #                 if json_file.endswith('.json'):
-    #                     json_file_path = os.path.join(folder_path, json_file)
-    #                     patient = OnePatient(json_file_path)
-    #                     if patient is not None:
-    #                         log_file.write(f'Processed file: {json_file_path}\n')
-    #                         log_file.write(f'Patient data:\n{patient}\n\n')
-    #                     patients[:, idx, :, :] = patient
-    return patients, file_name
+    return load_data.process_json_files(root_dir, patients, num_workers,
+                                        chunk_size, max_frame, loader=OnePatient,
+                                        num_joint=NUM_JOINT,
+                                        return_length=return_length,
+                                        num_person_in=num_person_in,
+                                        joint_index=JOINT_INDEX)
 
 # class DataGenerator(tf.keras.utils.Sequence):
 #     def __init__(self, video_paths, labels, batch_size, preprocess_fn):
@@ -158,7 +149,7 @@ if __name__ == "__main__":
     csv = pd.read_csv (path)
 
     path_json = "/media/dsp520/Grasp_2T/parkinson/LA/"
-    patients = np.zeros( (42, 700, 25, 2) )
+    patients = np.zeros( (42, 700, NUM_JOINT, 2) )
     patients, GT = process_json_files (path_json, patients)
     print( patients.shape )
     print( patients[2, 15, :] )
@@ -0,0 +1,100 @@
+import numpy as np
+
+
+def _to_numpy(x):
+    if hasattr(x, 'detach'):
+        x = x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+def _divide(a, b):
+    """ a / b, 0 where b is 0 (e.g. a class without any sample) """
+    return np.divide(a, b, out=np.zeros(np.shape(a)), where=np.asarray(b) > 0)
+
+
+class MetricAccumulator():
+    """ Streaming classification metrics, updated batch by batch without
+    keeping the scores
+    Arguments:
+        num_class: The number of classes, the ordinal levels 0 ~ num_class - 1
+        top_k: The k of the top-k accuracies to track
+
+    Only the confusion matrix of the top-1 predictions and the number of
+    top-k hits of each class are kept.
+    """
+
+    def __init__(self, num_class, top_k=(1,)):
+        self.num_class = num_class
+        self.top_k = tuple(top_k)
+        self.reset()
+
+    def reset(self):
+        self.confusion_matrix = np.zeros((self.num_class, self.num_class), dtype=np.int64)
+        self.hit_top_k = {k: np.zeros(self.num_class, dtype=np.int64) for k in self.top_k}
+
+    def update(self, score, label):
+        """ Add a batch of (N, num_class) scores and their (N,) labels, numpy
+        arrays or tensors """
+        score = _to_numpy(score)
+        label = _to_numpy(label).astype(np.int64).reshape(-1)
+        predict = score.argmax(axis=1)
+        self.confusion_matrix += np.bincount(
+            label * self.num_class + predict,
+            minlength=self.num_class**2).reshape(self.num_class, self.num_class)
+        for k in self.top_k:
+            k_ = min(k, self.num_class)
+            top = np.argpartition(-score, k_ - 1, axis=1)[:, :k_]
+            hit = (top == label[:, None]).any(axis=1)
+            self.hit_top_k[k] += np.bincount(label[hit], minlength=self.num_class)
+
+    @property
+    def num_sample(self):
+        return self.confusion_matrix.sum(axis=1)
+
+    def accuracy(self):
+        return _divide(np.trace(self.confusion_matrix), self.confusion_matrix.sum()).item()
+
+    def top_k_accuracy(self, k):
+        return _divide(self.hit_top_k[k].sum(), self.num_sample.sum()).item()
+
+    def top_k_by_category(self, k):
+        return _divide(self.hit_top_k[k], self.num_sample)
+
+    def precision(self):
+        return _divide(np.diag(self.confusion_matrix), self.confusion_matrix.sum(axis=0))
+
+    def recall(self):
+        return _divide(np.diag(self.confusion_matrix), self.num_sample)
+
+    def f1(self):
+        precision, recall = self.precision(), self.recall()
+        return _divide(2 * precision * recall, precision + recall)
+
+    def macro_f1(self):
+        return self.f1().mean().item()
+
+    def kappa(self):
+        """ Quadratic weighted kappa of the ordinal levels, 0 when the
+        expected disagreement is 0 """
+        observed = self.confusion_matrix.astype(float)
+        n = observed.sum()
+        if n == 0 or self.num_class < 2:
+            return 0.0
+        level = np.arange(self.num_class)
+        weight = (level[:, None] - level[None, :])**2 / (self.num_class - 1)**2
+        expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / n
+        disagreement = (weight * expected).sum()
+        if disagreement == 0:
+            return 0.0
+        return 1.0 - (weight * observed).sum() / disagreement
+
+    def result(self):
+        """ Return a dict of every metric """
+        result = dict(accuracy=self.accuracy(),
+                      precision=self.precision(),
+                      recall=self.recall(),
+                      macro_f1=self.macro_f1(),
+                      kappa=self.kappa())
+        for k in self.top_k:
+            result['top{}'.format(k)] = self.top_k_accuracy(k)
+        return result
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# the side arrays of the skeleton cache computed by `joint_quality`
+QUALITY_ARRAYS = ('missing', 'num_usable', 'num_empty', 'coord_min', 'coord_max')
+
+
+def joint_quality(data, length):
+    """
+    Data quality of freshly parsed patients, computed on the array already
+    in memory so ingestion does not read the frames a second time. A joint
+    is missing in a frame when all its coordinates are zero.
+
+    Parameters:
+    data (np.ndarray): (N, C, T, V, M) zero padded sequences.
+    length (np.ndarray): (N,) number of recorded frames of every patient.
+
+    Returns:
+    dict of
+    missing (N, V): ratio of the recorded frames each joint is missing in.
+    num_usable (N,): number of recorded frames with every joint detected.
+    num_empty (N,): number of recorded frames without any joint detected,
+        the frames no person was detected in.
+    coord_min, coord_max (N, C): range of the detected coordinates, nan if
+        nothing was detected.
+    """
+    N, C, T, V, M = data.shape
+    length = np.asarray(length)
+    recorded = np.arange(T)[None, :] < length[:, None]              # N, T
+    detected = (data != 0).any(axis=(1, 4)) & recorded[:, :, None]  # N, T, V
+
+    where = detected[:, None, :, :, None]
+    coord_min = data.min(axis=(2, 3, 4), where=where, initial=np.inf)
+    coord_max = data.max(axis=(2, 3, 4), where=where, initial=-np.inf)
+    empty = ~detected.any(axis=(1, 2))
+    coord_min[empty] = np.nan
+    coord_max[empty] = np.nan
+
+    return dict(
+        missing=1 - detected.sum(axis=1) / np.maximum(length, 1)[:, None],
+        num_usable=(detected.all(axis=2) & recorded).sum(axis=1),
+        num_empty=(~detected.any(axis=2) & recorded).sum(axis=1),
+        coord_min=coord_min,
+        coord_max=coord_max)
+
+
+def save_report(path, sample_name, length, quality):
+    """
+    Write the quality of every patient as one row of a csv table.
+    """
+    missing = np.asarray(quality['missing'])
+    table = pd.DataFrame({'sample_name': [str(n) for n in sample_name],
+                          'length': length,
+                          'usable_frame': quality['num_usable'],
+                          'empty_frame': quality['num_empty'],
+                          'missing': missing.mean(axis=1)})
+    for j in range(missing.shape[1]):
+        table['missing_{}'.format(j)] = missing[:, j]
+    for c, axis in enumerate('xyz'[:np.shape(quality['coord_min'])[1]]):
+        table['{}_min'.format(axis)] = quality['coord_min'][:, c]
+        table['{}_max'.format(axis)] = quality['coord_max'][:, c]
+    table.round(4).to_csv(path, index=False)
+
+
+def check_quality(sample_name, quality, max_missing=1.0, min_usable_frame=0):
+    """
+    Return the mask of patients passing the thresholds, the others are
+    reported with their reason.
+
+    Parameters:
+    max_missing (float): largest mean ratio of missing joints.
+    min_usable_frame (int): smallest number of frames with every joint detected.
+    """
+    missing = np.asarray(quality['missing']).mean(axis=1)
+    num_usable = np.asarray(quality['num_usable'])
+    keep = (missing <= max_missing) & (num_usable >= min_usable_frame)
+    if not keep.all():
+        print('Quality check: {} of {} patients excluded.'.format(
+            (~keep).sum(), len(keep)))
+        for i in np.flatnonzero(~keep):
+            print('\t{:.1%} joints missing, {} usable frames: {}'.format(
+                missing[i], num_usable[i], sample_name[i]))
+    return keep
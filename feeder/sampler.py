@@ -0,0 +1,80 @@
+import numpy as np
+import torch
+
+
+class BucketBatchSampler(torch.utils.data.Sampler):
+    """ Batch sampler grouping samples of similar length
+    Arguments:
+        lengths: The true sequence length of every sample
+        batch_size: The number of samples per batch
+        shuffle: If true, draw new pools and shuffle the batch order every epoch
+        drop_last: If true, drop the last incomplete batch
+        pool_size: The number of batches in a pool, samples are sorted by
+            length inside a randomly drawn pool, so batches change every epoch
+            while staying homogeneous in length
+        seed: The random seed of the sampler
+
+    After every epoch `stats` holds the number of samples, of true frames and
+    of frames after padding each batch to its own maximum length.
+    """
+
+    def __init__(self, lengths, batch_size, shuffle=True, drop_last=False,
+                 pool_size=50, seed=None):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.pool_size = pool_size
+        self.random_state = np.random.RandomState(seed)
+        self.stats = dict(num_sample=0, num_frame=0, num_padded=0)
+
+    def batches(self):
+        if self.shuffle:
+            order = self.random_state.permutation(len(self.lengths))
+        else:
+            order = np.arange(len(self.lengths))
+
+        batches = []
+        pool = self.batch_size * self.pool_size
+        for begin in range(0, len(order), pool):
+            chunk = order[begin:begin + pool]
+            chunk = chunk[np.argsort(self.lengths[chunk], kind='stable')]
+            batches.extend(chunk[i:i + self.batch_size]
+                           for i in range(0, len(chunk), self.batch_size))
+        if self.drop_last:
+            batches = [b for b in batches if len(b) == self.batch_size]
+        if self.shuffle:
+            self.random_state.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        batches = self.batches()
+        length = [self.lengths[b] for b in batches]
+        self.stats = dict(num_sample=int(sum(len(l) for l in length)),
+                          num_frame=int(sum(l.sum() for l in length)),
+                          num_padded=int(sum(len(l) * l.max() for l in length)))
+        for b in batches:
+            yield b.tolist()
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.lengths) // self.batch_size
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+
+    def padding_waste(self):
+        """ The ratio of padded zero frames in the last epoch """
+        if self.stats['num_padded'] == 0:
+            return 0.0
+        return 1.0 - self.stats['num_frame'] / self.stats['num_padded']
+
+
+def pad_collate(batch):
+    """ Collate (C, T_i, V, M) samples of different length, zero padded at the
+    end to the longest sample of the batch """
+    data, label = zip(*batch)
+    C, _, V, M = data[0].shape
+    T = max(d.shape[1] for d in data)
+    data_batch = np.zeros((len(data), C, T, V, M), dtype=np.float32)
+    for i, d in enumerate(data):
+        data_batch[i, :, :d.shape[1]] = d
+    return torch.from_numpy(data_batch), torch.as_tensor(np.array(label))
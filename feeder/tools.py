@@ -1,5 +1,8 @@
 import numpy as np
 import random
+import torch
+
+from .metrics import MetricAccumulator
 
 
 def downsample(data_numpy, step, random_sample=True):
@@ -101,6 +104,61 @@ def random_move(data_numpy,
     return data_numpy
 
 
+def random_move_batch(data,
+                      angle_candidate=[-10., -5., 0., 5., 10.],
+                      scale_candidate=[0.9, 1.0, 1.1],
+                      transform_candidate=[-0.2, -0.1, 0.0, 0.1, 0.2],
+                      move_time_candidate=[1],
+                      generator=None,
+                      inplace=False):
+    """ Batched `random_move`: every sample of the (N, C, T, V, M) tensor
+    `data` gets its own transform, drawn from the same distribution, and all
+    the per-frame affine transforms are applied by one einsum on the device
+    of `data`. The parameters are drawn on the cpu from `generator`, a
+    seeded torch.Generator or None for the global one. With `inplace` the
+    coordinates of `data` are overwritten instead of a copy.
+    """
+    N, C, T, V, M = data.shape
+
+    def choice(candidate, size):
+        index = torch.randint(len(candidate), size, generator=generator)
+        return torch.tensor(candidate, dtype=torch.float64)[index]
+
+    # (N, 4, T): angle, scale, t_x and t_y of every frame
+    param = torch.zeros(N, 4, T, dtype=torch.float64)
+    move_time = choice(move_time_candidate, (N,)).long()
+    for k in move_time.unique().tolist():
+        rows = (move_time == k).nonzero()[:, 0]
+        node = np.arange(0, T, T * 1.0 / k).round().astype(int)
+        node = np.append(node, T)
+        num_node = len(node)
+
+        # linspace between consecutive nodes, as a (num_node, T) matrix
+        weight = np.zeros((num_node, T))
+        for i in range(num_node - 1):
+            w = np.linspace(0, 1, node[i + 1] - node[i])
+            weight[i, node[i]:node[i + 1]] = 1 - w
+            weight[i + 1, node[i]:node[i + 1]] = w
+
+        node_param = torch.stack([
+            choice(angle_candidate, (len(rows), num_node)) * np.pi / 180,
+            choice(scale_candidate, (len(rows), num_node)),
+            choice(transform_candidate, (len(rows), num_node)),
+            choice(transform_candidate, (len(rows), num_node))], dim=1)
+        param[rows] = node_param @ torch.from_numpy(weight)
+
+    param = param.to(device=data.device, dtype=data.dtype)
+    a, s, t_xy = param[:, 0], param[:, 1], param[:, 2:4]
+    theta = torch.stack([torch.stack([torch.cos(a) * s, -torch.sin(a) * s], dim=1),
+                         torch.stack([torch.sin(a) * s, torch.cos(a) * s], dim=1)],
+                        dim=1)                                    # N, 2, 2, T
+
+    new_data = data if inplace else data.clone()
+    new_data[:, 0:2] = torch.einsum('nijt,njtvm->nitvm', theta, data[:, 0:2]) \
+        + t_xy[:, :, :, None, None]
+    return new_data
+
+
 def random_shift(data_numpy):
     # input: C,T,V,M
     C, T, V, M = data_numpy.shape
@@ -117,6 +175,16 @@ def random_shift(data_numpy):
 
 
 def openpose_match(data_numpy):
+    """ Reorder the people of every frame so each index follows one person
+    through the sequence, then sort the people by their total confidence.
+
+    In each frame, people are greedily matched to the closest people of the
+    next frame in order of confidence. The matches are chained into a
+    cumulative permutation by a prefix scan of gathers, and the data is
+    reordered by a single take_along_axis.
+
+    input: (3, T, V, M) with the confidence as the last channel
+    """
     C, T, V, M = data_numpy.shape
     assert (C == 3)
     score = data_numpy[2, :, :, :].sum(axis=1)
@@ -130,71 +198,152 @@ def openpose_match(data_numpy):
     # square of distance between frame 1&2 (shape: T-1, M, M)
     distance = ((xy2 - xy1)**2).sum(axis=2).sum(axis=0)
 
-    # match pose
+    # match pose, all the frames at once: at step m the row is the position
+    # of person m in the rank of its frame
+    frame = np.arange(T - 1)
+    position = rank.argsort(axis=1)
     forward_map = np.zeros((T, M), dtype=int) - 1
     forward_map[0] = range(M)
     for m in range(M):
-        choose = (rank == m)
-        forward = distance[choose].argmin(axis=1)
-        for t in range(T - 1):
-            distance[t, :, forward[t]] = np.inf
-        forward_map[1:][choose] = forward
+        row = position[:, m]
+        forward = distance[frame, row].argmin(axis=1)
+        distance[frame, :, forward] = np.inf
+        forward_map[frame + 1, row] = forward
     assert (np.all(forward_map >= 0))
 
-    # string data
-    for t in range(T - 1):
-        forward_map[t + 1] = forward_map[t + 1][forward_map[t]]
+    # string data: forward_map[t] = forward_map[t][forward_map[t - 1]], as a
+    # prefix scan over t in log2(T) steps
+    step = 1
+    while step < T:
+        forward_map[step:] = np.take_along_axis(forward_map[step:],
+                                                forward_map[:-step], axis=1)
+        step *= 2
 
-    # generate data
-    new_data_numpy = np.zeros(data_numpy.shape)
-    for t in range(T):
-        new_data_numpy[:, t, :, :] = data_numpy[:, t, :, forward_map[
-            t]].transpose(1, 2, 0)
-    data_numpy = new_data_numpy
-
-    # score sort
-    trace_score = data_numpy[2, :, :, :].sum(axis=1).sum(axis=0)
+    # score sort, then generate data with one gather
+    trace_score = np.take_along_axis(score, forward_map, axis=1).sum(axis=0)
     rank = (-trace_score).argsort()
-    data_numpy = data_numpy[:, :, :, rank]
+    index = forward_map[:, rank]
+    return np.take_along_axis(data_numpy, index[None, :, None, :], axis=3)
 
-    return data_numpy
+
+def select_person(data_numpy, num_iter=2, num_candidate=100):
+    """ Keep the one person that stays in place through the sequence, e.g. the
+    seated patient among a clinician walking by or a reflection.
+
+    Like `openpose_match`, people are matched by the distance of their
+    centers, but against one reference position instead of frame to frame,
+    so every frame is assigned independently. The reference is the detected
+    center, out of those of `num_candidate` sampled frames, that has someone
+    within half a skeleton size in the most frames. It is then refined
+    `num_iter` times as the median center of the chosen people.
+
+    data_numpy: (3, T, V, M) with the confidence as the last channel
+    returns: (3, T, V, 1), frames without anyone within a skeleton size of
+        the reference are zero
+    """
+    C, T, V, M = data_numpy.shape
+    assert (C == 3)
+    valid = data_numpy[2] > 0                                 # T, V, M
+    count = valid.sum(axis=1)                                 # T, M
+    detected = count > 0
+    center = (data_numpy[0:2] * valid).sum(axis=2) / np.maximum(count, 1)
+    choose = np.zeros(T, dtype=int)
+
+    if detected.any():
+        # skeleton size: the largest extent of the valid joints of each person
+        extent = (data_numpy[0:2].max(axis=2, where=valid, initial=-np.inf) -
+                  data_numpy[0:2].min(axis=2, where=valid, initial=np.inf))
+        size = extent.max(axis=0)                             # T, M
+        radius = max(np.median(size[detected]) / 2, 1e-6)
+
+        # center to every person (K, T, M), the support of a candidate is
+        # the number of frames with a person close to it
+        frames = np.flatnonzero(detected.any(axis=1))
+        frames = frames[::max(1, len(frames) // num_candidate)]
+        candidate = center[:, frames][:, detected[frames]]    # 2, K
+        distance = ((center[:, None] - candidate[:, :, None, None])**2).sum(axis=0)
+        distance[:, ~detected] = np.inf
+        support = (distance.min(axis=2) < radius**2).sum(axis=1)
+        reference = candidate[:, support.argmax()]
+
+        for _ in range(num_iter + 1):
+            distance = ((center - reference[:, None, None])**2).sum(axis=0)
+            distance[~detected] = np.inf
+            choose = distance.argmin(axis=1)
+            # nobody within a skeleton size: the patient is not in the frame
+            found = distance.min(axis=1) < (2 * radius)**2
+            chosen = np.take_along_axis(center, choose[None, :, None], axis=2)
+            reference = np.median(chosen[:, found, 0], axis=1)
+    else:
+        found = np.zeros(T, dtype=bool)
+
+    index = np.broadcast_to(choose[None, :, None, None], (C, T, V, 1))
+    new_data_numpy = np.take_along_axis(data_numpy, index, axis=3)
+    new_data_numpy[:, ~found] = 0
+    return new_data_numpy
+
+
+def interpolate_missing(data_numpy, max_gap):
+    """ Fill the joints missing (every channel zero) for at most `max_gap`
+    consecutive frames, linearly along T between the detections on both
+    sides of the gap. Leading, trailing and longer gaps stay zero, so the
+    zero padding after the end of a sequence is never filled.
+
+    input: (..., C, T, V, M), any number of leading sample dimensions
+    """
+    data = np.moveaxis(data_numpy, -3, -1)                # ..., C, V, M, T
+    T = data.shape[-1]
+    t = np.arange(T)
+    valid = (data != 0).any(axis=-4)                      # ..., V, M, T
+
+    # the last detection before and the first detection after every frame
+    prev = np.maximum.accumulate(np.where(valid, t, -1), axis=-1)
+    next = np.minimum.accumulate(np.where(valid, t, T)[..., ::-1], axis=-1)[..., ::-1]
+    fill = ~valid & (prev >= 0) & (next < T) & (next - prev - 1 <= max_gap)
+
+    prev = np.where(fill, prev, t)[..., None, :, :, :]
+    next = np.where(fill, next, t)[..., None, :, :, :]
+    weight = (t - prev) / np.maximum(next - prev, 1)
+    x_prev = np.take_along_axis(data, prev, axis=-1)
+    x_next = np.take_along_axis(data, next, axis=-1)
+    filled = np.where(fill[..., None, :, :, :],
+                      x_prev * (1 - weight) + x_next * weight, data)
+    return np.moveaxis(filled, -1, -3).astype(data_numpy.dtype, copy=False)
+
+
+def motion(data_numpy, out=None):
+    """ The second order temporal difference x[t] - x[t+1] / 2 - x[t-1] / 2,
+    the input of the motion stream of `net.st_gcn_twostream.Model`, zero on
+    the first and last frames. It is written to `out` if given.
+
+    input: (..., C, T, V, M), any number of leading sample dimensions
+    """
+    x = data_numpy
+    if out is None:
+        out = np.zeros_like(x)
+    else:
+        out[..., [0, -1], :, :] = 0
+    out[..., 1:-1, :, :] = x[..., 1:-1, :, :] - 0.5 * x[..., 2:, :, :] - 0.5 * x[..., :-2, :, :]
+    return out
+
+
+def stack_motion(data_numpy):
+    """ Stack the motion of (..., C, T, V, M) positions after them along the
+    channels, (..., 2C, T, V, M) """
+    return np.concatenate((data_numpy, motion(data_numpy)), axis=-4)
 
 
 def top_k_by_category(label, score, top_k):
-    instance_num, class_num = score.shape
-    rank = score.argsort()
-    hit_top_k = [[] for i in range(class_num)]
-    for i in range(instance_num):
-        l = label[i]
-        hit_top_k[l].append(l in rank[i, -top_k:])
-
-    accuracy_list = []
-    for hit_per_category in hit_top_k:
-        if hit_per_category:
-            accuracy_list.append(sum(hit_per_category) * 1.0 / len(hit_per_category))
-        else:
-            accuracy_list.append(0.0)
-    return accuracy_list
+    """ The top-k accuracy of every category, 0 for a category without any
+    instance, see `feeder.metrics.MetricAccumulator` """
+    metric = MetricAccumulator(score.shape[1], top_k=(top_k,))
+    metric.update(score, label)
+    return metric.top_k_by_category(top_k).tolist()
 
 
 def calculate_recall_precision(label, score):
-    instance_num, class_num = score.shape
-    rank = score.argsort()
-    confusion_matrix = np.zeros([class_num, class_num])
-
-    for i in range(instance_num):
-        true_l = label[i]
-        pred_l = rank[i, -1]
-        confusion_matrix[true_l][pred_l] += 1
-
-    precision = []
-    recall = []
-
-    for i in range(class_num):
-        true_p = confusion_matrix[i][i]
-        false_n = sum(confusion_matrix[i, :]) - true_p
-        false_p = sum(confusion_matrix[:, i]) - true_p
-        precision.append(true_p * 1.0 / (true_p + false_p))
-        recall.append(true_p * 1.0 / (true_p + false_n))
-
-    return precision, recall
\ No newline at end of file
+    """ The precision and recall of every category, 0 where a category is
+    never predicted or has no instance """
+    metric = MetricAccumulator(score.shape[1])
+    metric.update(score, label)
+    return metric.precision().tolist(), metric.recall().tolist()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Ingest patient recordings while OpenPose is still writing their frames.
+
+Every new patient folder under `--json_path` is tailed by polling, each
+frame file is parsed as soon as the next one appears, so pose extraction
+and parsing overlap. A recording is closed by a `done` file in its folder,
+by `--idle_timeout` seconds without a new frame or by reaching
+`--max_frame`, its sequence is then saved to `--out_dir`:
+
+    python -m feeder.watcher --json_path dataset/LA --out_dir dataset/stream
+"""
+import os
+import time
+import argparse
+import numpy as np
+
+from feeder import load_data
+from feeder import load_data_low_limb as loader # load the low limb joints of each video
+# from feeder import load_data as loader          # load the whole joints of each video
+from . import tools
+
+# a file of this name in a patient folder marks the end of the recording
+SENTINEL = 'done'
+
+
+class PatientStream():
+    """ Parse the frame files of one patient folder while they are written
+    Arguments:
+        folder_path: the patient folder OpenPose writes the frame files to
+        max_frame: The maximum number of frames kept, the recording is
+            closed once they are parsed
+        num_person_in: The maximum number of people parsed per frame, see
+            `feeder.load_data.load_frames`
+        idle_timeout: The recording is closed after this many seconds
+            without a new frame file
+        capacity: The initial number of frames of the buffer, it is doubled
+            whenever it is full
+
+    A frame file is parsed once a later one exists, so a file still being
+    written is never read, the last one is parsed when the recording closes.
+    """
+
+    def __init__(self, folder_path, max_frame=700, num_person_in=1,
+                 idle_timeout=10.0, capacity=64):
+        self.folder_path = str(folder_path)
+        self.max_frame = max_frame
+        self.num_person_in = num_person_in
+        self.idle_timeout = idle_timeout
+        self.num_frame = 0
+        self.num_seen = 0
+        self.last_change = time.time()
+        self.closed = False
+
+        # frames of (V, 2) coordinates, or of (3, 25, M) people
+        if num_person_in == 1:
+            frame_shape = (loader.NUM_JOINT, 2)
+        else:
+            frame_shape = (3, load_data.NUM_JOINT, num_person_in)
+        self.buffer = np.zeros((min(capacity, max_frame),) + frame_shape)
+
+    def reserve(self, num_frame):
+        """ Grow the buffer to hold at least `num_frame` frames """
+        capacity = len(self.buffer)
+        if num_frame <= capacity:
+            return
+        while capacity < num_frame:
+            capacity *= 2
+        buffer = np.zeros((min(capacity, self.max_frame),) + self.buffer.shape[1:])
+        buffer[:self.num_frame] = self.buffer[:self.num_frame]
+        self.buffer = buffer
+
+    def parse(self, json_file_paths):
+        self.reserve(self.num_frame + len(json_file_paths))
+        for json_file_path in json_file_paths:
+            if self.num_person_in == 1:
+                loader.OnePatient(json_file_path, out=self.buffer[self.num_frame])
+            else:
+                load_data.load_people(json_file_path, out=self.buffer[self.num_frame])
+            self.num_frame += 1
+
+    def poll(self, now=None):
+        """ Parse the frame files completed since the last poll, returns True
+        once the recording is closed """
+        if self.closed:
+            return True
+        if now is None:
+            now = time.time()
+        # the folder is listed again on every poll (sorted os.listdir)
+        json_file_paths = load_data.list_frames(self.folder_path, self.max_frame)
+        if len(json_file_paths) > self.num_seen:
+            self.num_seen = len(json_file_paths)
+            self.last_change = now
+
+        self.closed = (len(json_file_paths) == self.max_frame or
+                       now - self.last_change > self.idle_timeout or
+                       os.path.exists(os.path.join(self.folder_path, SENTINEL)))
+        # the newest file may still be written until the recording closes
+        end = len(json_file_paths) if self.closed else len(json_file_paths) - 1
+        if end > self.num_frame:
+            self.parse(json_file_paths[self.num_frame:end])
+        return self.closed
+
+    def result(self):
+        """ Return the sequence in the layout of the skeleton cache, (C, T, V, M)
+        zero padded to `max_frame`, and its true length """
+        data = np.zeros((2, self.max_frame, loader.NUM_JOINT, 1), dtype=np.float32)
+        frames = self.buffer[:self.num_frame]
+        if self.num_person_in == 1:
+            data[:, :self.num_frame, :, 0] = frames.transpose(2, 0, 1)
+        else:
+            patient = tools.select_person(frames.transpose(1, 0, 2, 3))[..., 0]
+            data[:, :self.num_frame, :, 0] = patient[0:2, :, loader.JOINT_INDEX]
+        return data, self.num_frame
+
+
+def watch(json_path, callback, max_frame=700, num_person_in=1,
+          idle_timeout=10.0, poll_interval=0.5, skip_existing=True,
+          max_patient=None):
+    """
+    Tail every new patient folder of `json_path` and hand each closed
+    recording to `callback(folder_path, data, length)`, `data` being the
+    (C, T, V, M) sequence of `PatientStream.result`. A scoring callback can
+    wrap it into a batch of one, e.g. `model(torch.from_numpy(data[None]))`.
+
+    Parameters:
+    json_path (str): root directory OpenPose writes the patient folders to.
+    callback (callable): called once per closed recording.
+    max_frame (int): maximum number of frames kept per patient.
+    num_person_in (int): maximum number of people parsed per frame.
+    idle_timeout (float): seconds without a new frame closing a recording.
+    poll_interval (float): seconds between two scans of the folders.
+    skip_existing (bool): if True, folders present at start are ignored.
+    max_patient (int): return after that many recordings, None to run forever.
+    """
+    streams = dict()
+    done = set(load_data.list_patients(json_path)) if skip_existing else set()
+    num_patient = 0
+    while max_patient is None or num_patient < max_patient:
+        for folder_path in load_data.list_patients(json_path):
+            if folder_path not in done and folder_path not in streams:
+                streams[folder_path] = PatientStream(folder_path, max_frame,
+                                                     num_person_in, idle_timeout)
+        for folder_path, stream in list(streams.items()):
+            if stream.poll():
+                data, length = stream.result()
+                callback(folder_path, data, length)
+                done.add(folder_path)
+                del streams[folder_path]
+                num_patient += 1
+        time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming LA dataset ingest')
+    parser.add_argument('--json_path', default=os.path.join('dataset', 'LA'), help='the root OpenPose writes the patient folders to')
+    parser.add_argument('--out_dir', default=os.path.join('dataset', 'stream'), help='the folder the closed recordings are saved to')
+    parser.add_argument('--max_frame', type=int, default=700, help='the maximum number of frames kept per patient')
+    parser.add_argument('--num_person_in', type=int, default=1, help='the maximum number of people parsed per frame')
+    parser.add_argument('--idle_timeout', type=float, default=10.0, help='the seconds without a new frame closing a recording')
+    parser.add_argument('--poll_interval', type=float, default=0.5, help='the seconds between two scans')
+    parser.add_argument('--include_existing', action='store_true', help='also ingest the folders present at start')
+    arg = parser.parse_args()
+
+    if not os.path.exists(arg.out_dir):
+        os.makedirs(arg.out_dir)
+
+    def save(folder_path, data, length):
+        name = os.path.basename(folder_path)
+        np.savez(os.path.join(arg.out_dir, name + '.npz'), data=data, length=length)
+        num_empty = (~data[:, :length].any(axis=(0, 2, 3))).sum()
+        print('{}: {} frames, {} without a person, saved to {}.'.format(
+            name, length, num_empty, arg.out_dir))
+
+    watch(arg.json_path, save, arg.max_frame, arg.num_person_in,
+          arg.idle_timeout, arg.poll_interval, not arg.include_existing)
+
+
+if __name__ == '__main__':
+    main()
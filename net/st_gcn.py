@@ -1,7 +1,10 @@
+import copy
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch.autograd import Variable
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 
 from net.utils.tgcn import ConvTemporalGraphical
 from net.utils.graph import Graph
@@ -15,10 +18,13 @@ class Model(nn.Module):
         graph_args (dict): The arguments for building the graph
         edge_importance_weighting (bool): If ``True``, adds a learnable
             importance weighting to the edges of the graph
+        groups (int, optional): Number of independent networks run side by
+            side as grouped convolutions, their inputs stacked along the
+            channels and their scores summed. Default: 1
         **kwargs (optional): Other parameters for graph convolution units
 
     Shape:
-        - Input: :math:`(N, in_channels, T_{in}, V_{in}, M_{in})`
+        - Input: :math:`(N, groups * in_channels, T_{in}, V_{in}, M_{in})`
         - Output: :math:`(N, num_class)` where
             :math:`N` is a batch size,
             :math:`T_{in}` is a length of input sequence,
@@ -27,7 +33,7 @@ class Model(nn.Module):
     """
 
     def __init__(self, in_channels, num_class, graph_args,
-                 edge_importance_weighting, **kwargs):
+                 edge_importance_weighting, groups=1, **kwargs):
         super().__init__()
 
         # load graph
@@ -39,79 +45,132 @@ class Model(nn.Module):
         spatial_kernel_size = A.size(0)
         temporal_kernel_size = 9
         kernel_size = (temporal_kernel_size, spatial_kernel_size)
-        self.data_bn = nn.BatchNorm1d(in_channels * A.size(1))
+        self.in_channels = in_channels
+        self.groups = G = groups
+        self.data_bn = nn.BatchNorm1d(G * in_channels * A.size(1))
+        # scale of the folded data_bn, set by `optimize_for_inference`
+        self.register_buffer('data_scale', None)
+        kwargs = dict(kwargs, groups=G)
         kwargs0 = {k: v for k, v in kwargs.items() if k != 'dropout'}
         self.st_gcn_networks = nn.ModuleList((
-            st_gcn(in_channels, 64, kernel_size, 1, residual=False, **kwargs0),
-            st_gcn(64, 64, kernel_size, 1, **kwargs),
+            st_gcn(G * in_channels, G * 64, kernel_size, 1, residual=False, **kwargs0),
+            st_gcn(G * 64, G * 64, kernel_size, 1, **kwargs),
             # st_gcn(64, 64, kernel_size, 1, **kwargs),
-            st_gcn(64, 64, kernel_size, 1, **kwargs),
-            st_gcn(64, 128, kernel_size, 2, **kwargs),
+            st_gcn(G * 64, G * 64, kernel_size, 1, **kwargs),
+            st_gcn(G * 64, G * 128, kernel_size, 2, **kwargs),
             # st_gcn(128, 128, kernel_size, 1, **kwargs),
-            st_gcn(128, 128, kernel_size, 1, **kwargs),
-            st_gcn(128, 256, kernel_size, 2, **kwargs),
+            st_gcn(G * 128, G * 128, kernel_size, 1, **kwargs),
+            st_gcn(G * 128, G * 256, kernel_size, 2, **kwargs),
             # st_gcn(256, 256, kernel_size, 1, **kwargs),
-            st_gcn(256, 256, kernel_size, 1, **kwargs),
+            st_gcn(G * 256, G * 256, kernel_size, 1, **kwargs),
         ))
 
         # initialize parameters for edge importance weighting
+        # one (K, V, V) importance per group
         if edge_importance_weighting:
+            shape = self.A.size() if G == 1 else (G,) + self.A.size()
             self.edge_importance = nn.ParameterList([
-                nn.Parameter(torch.ones(self.A.size()))
+                nn.Parameter(torch.ones(shape))
                 for i in self.st_gcn_networks
             ])
         else:
             self.edge_importance = [1] * len(self.st_gcn_networks)
+        self._adjacency_key = None
 
         # fcn for prediction
-        self.fcn = nn.Conv2d(256, num_class, kernel_size=1)
+        self.fcn = nn.Conv2d(G * 256, G * num_class, kernel_size=1, groups=G)
 
     def forward(self, x):
 
         # data normalization
         N, C, T, V, M = x.size()
-        x = x.permute(0, 4, 3, 1, 2).contiguous()
-        x = x.view(N * M, V * C, T)
-        x = self.data_bn(x)
-        x = x.view(N, M, V, C, T)
-        x = x.permute(0, 1, 3, 4, 2).contiguous()
-        x = x.view(N * M, C, T, V)
+        x = self.normalize(x)
 
         # forwad
-        for gcn, importance in zip(self.st_gcn_networks, self.edge_importance):
-            x, _ = gcn(x, self.A * importance)
+        for gcn, A in zip(self.st_gcn_networks, self.adjacency()):
+            x, _ = gcn(x, A)
 
         # global pooling
         x = F.avg_pool2d(x, x.size()[2:])
         x = x.view(N, M, -1, 1, 1).mean(dim=1)
 
-        # prediction
+        # prediction, summed over the groups
         x = self.fcn(x)
-        x = x.view(x.size(0), -1)
+        x = x.view(x.size(0), self.groups, -1).sum(dim=1)
 
         return x
 
-    def extract_feature(self, x):
-
-        # data normalization
+    def normalize(self, x):
+        """ Apply data_bn and reshape (N, C, T, V, M) to (N * M, C, T, V) """
         N, C, T, V, M = x.size()
+        if self.data_scale is not None:
+            # the shift of data_bn is folded in the first graph convolution,
+            # its scale is applied by the copy to the (N, M, C, T, V) layout
+            out = x.new_empty(N, M, C, T, V)
+            torch.mul(x.permute(0, 4, 1, 2, 3), self.data_scale, out=out)
+            return out.view(N * M, C, T, V)
+
         x = x.permute(0, 4, 3, 1, 2).contiguous()
         x = x.view(N * M, V * C, T)
         x = self.data_bn(x)
         x = x.view(N, M, V, C, T)
         x = x.permute(0, 1, 3, 4, 2).contiguous()
-        x = x.view(N * M, C, T, V)
+        return x.view(N * M, C, T, V)
+
+    def optimize_for_inference(self):
+        """ Return an equivalent copy of the model for inference only.
+
+        Every batch normalization is folded into the convolution before it,
+        dropout is removed and the adjacency of every layer is frozen, so
+        the copy can neither be trained nor take new edge importances.
+        data_bn normalizes every joint separately, which a graph convolution
+        sharing its weights over the joints cannot absorb: only its shift is
+        folded, its scale is kept as a (C, 1, V) multiplier.
+        """
+        model = copy.deepcopy(self).eval()
+        with torch.no_grad():
+            V = model.A.size(1)
+            scale, shift = _bn_affine(model.data_bn)
+            scale = scale.view(V, -1).t()
+            shift = shift.view(V, -1).t()
+            model.data_scale = scale.reshape(-1, 1, V).contiguous()
+            model.data_bn = None
+
+            adjacency = model.adjacency()
+            for i, (gcn, A) in enumerate(zip(model.st_gcn_networks, adjacency)):
+                gcn.optimize_for_inference(A, shift if i == 0 else None)
+        return model
+
+    def adjacency(self):
+        """ The importance weighted adjacency of every layer. In eval mode
+        without autograd it is computed once and reused until A or an edge
+        importance is modified or moved """
+        if self.training or torch.is_grad_enabled():
+            return [self.A * importance for importance in self.edge_importance]
+
+        key = [(t.data_ptr(), t._version) for t in [self.A, *self.edge_importance]
+               if isinstance(t, torch.Tensor)]
+        if key != self._adjacency_key:
+            self._adjacency = [self.A * importance for importance in self.edge_importance]
+            self._adjacency_key = key
+        return self._adjacency
+
+    def extract_feature(self, x):
+
+        # data normalization
+        N, C, T, V, M = x.size()
+        x = self.normalize(x)
 
         # forwad
-        for gcn, importance in zip(self.st_gcn_networks, self.edge_importance):
-            x, _ = gcn(x, self.A * importance)
+        for gcn, A in zip(self.st_gcn_networks, self.adjacency()):
+            x, _ = gcn(x, A)
 
         _, c, t, v = x.size()
         feature = x.view(N, M, c, t, v).permute(0, 2, 3, 4, 1)
 
         # prediction
         x = self.fcn(x)
-        output = x.view(N, M, -1, t, v).permute(0, 2, 3, 4, 1)
+        output = x.view(N, M, self.groups, -1, t, v).sum(dim=2).permute(0, 2, 3, 4, 1)
 
         return output, feature
 
@@ -125,6 +184,7 @@ class st_gcn(nn.Module):
         stride (int, optional): Stride of the temporal convolution. Default: 1
         dropout (int, optional): Dropout rate of the final output. Default: 0
         residual (bool, optional): If ``True``, applies a residual mechanism. Default: ``True``
+        groups (int, optional): Number of independent groups of channels. Default: 1
 
     Shape:
         - Input[0]: Input graph sequence in :math:`(N, in_channels, T_{in}, V)` format
@@ -146,7 +206,8 @@ class st_gcn(nn.Module):
                  kernel_size,
                  stride=1,
                  dropout=0,
-                 residual=True):
+                 residual=True,
+                 groups=1):
         super().__init__()
 
         assert len(kernel_size) == 2
@@ -154,7 +215,7 @@ class st_gcn(nn.Module):
         padding = ((kernel_size[0] - 1) // 2, 0)
 
         self.gcn = ConvTemporalGraphical(in_channels, out_channels,
-                                         kernel_size[1])
+                                         kernel_size[1], groups=groups)
 
         self.tcn = nn.Sequential(
             nn.BatchNorm2d(out_channels),
@@ -165,16 +226,17 @@ class st_gcn(nn.Module):
                 (kernel_size[0], 1),
                 (stride, 1),
                 padding,
+                groups=groups,
             ),
             nn.BatchNorm2d(out_channels),
             nn.Dropout(dropout, inplace=True),
         )
 
         if not residual:
-            self.residual = lambda x: 0
+            self.residual = Zero()
 
         elif (in_channels == out_channels) and (stride == 1):
-            self.residual = lambda x: x
+            self.residual = nn.Identity()
 
         else:
             self.residual = nn.Sequential(
@@ -182,16 +244,39 @@ class st_gcn(nn.Module):
                     in_channels,
                     out_channels,
                     kernel_size=1,
-                    stride=(stride, 1)),
+                    stride=(stride, 1),
+                    groups=groups),
                 nn.BatchNorm2d(out_channels),
             )
 
         self.relu = nn.ReLU(inplace=True)
 
+    def optimize_for_inference(self, A, input_shift=None):
+        """ Fold the batch normalizations into the convolutions before them
+        and remove dropout, for inference with the fixed adjacency A """
+        bn, relu, conv, bn_out = self.tcn[:4]
+        self.gcn.fold(A, *_bn_affine(bn), input_shift=input_shift)
+        self.tcn = nn.Sequential(relu, fuse_conv_bn_eval(conv, bn_out))
+        if isinstance(self.residual, nn.Sequential):
+            self.residual = fuse_conv_bn_eval(*self.residual)
+
     def forward(self, x, A):
 
         res = self.residual(x)
         x, A = self.gcn(x, A)
         x = self.tcn(x) + res
 
-        return self.relu(x), A
\ No newline at end of file
+        return self.relu(x), A
+
+
+class Zero(nn.Module):
+    """ The residual of a block without residual mechanism """
+
+    def forward(self, x):
+        return x.new_zeros([])
+
+
+def _bn_affine(bn):
+    """ The scale and shift of a batch normalization in eval mode """
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    return scale, bn.bias - bn.running_mean * scale
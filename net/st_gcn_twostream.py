@@ -1,26 +1,135 @@
+import copy
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
-
-from net.utils.tgcn import ConvTemporalGraphical
-from net.utils.graph import Graph
 
 from .st_gcn import Model as ST_GCN
 
+# the submodules of the two sequential streams
+STREAMS = ('origin_stream.', 'motion_stream.')
+
+
+def motion(x):
+    """ The second order temporal difference of (N, C, T, V, M) sequences,
+    zero on the first and last frames """
+    m = x[:, :, 1:-1] - 0.5 * x[:, :, 2:] - 0.5 * x[:, :, :-2]
+    return F.pad(m, (0, 0, 0, 0, 1, 1))
+
+
 class Model(nn.Module):
+    r"""Two-stream spatial temporal graph convolutional networks, one stream
+    on the positions and one on their motion, their scores summed.
+
+    The streams run one after the other. Checkpoints of
+    ``SinglePassModel`` are converted when loaded.
+
+    Args:
+        Same as ``net.st_gcn.Model``
+
+    Shape:
+        - Input: :math:`(N, in_channels, T_{in}, V_{in}, M_{in})` positions, or
+          :math:`(N, 2 * in_channels, T_{in}, V_{in}, M_{in})` positions
+          stacked with their motion, e.g. by the feeder with ``motion=True``
+        - Output: :math:`(N, num_class)`
+    """
 
     def __init__(self, *args, **kwargs):
         super().__init__()
 
         self.origin_stream = ST_GCN(*args, **kwargs)
         self.motion_stream = ST_GCN(*args, **kwargs)
+        self.in_channels = self.origin_stream.in_channels
+        self._register_load_state_dict_pre_hook(split_streams)
+
+    def forward(self, x):
+        C = self.in_channels
+        if x.size(1) == 2 * C:
+            return self.origin_stream(x[:, :C]) + self.motion_stream(x[:, C:])
+        return self.origin_stream(x) + self.motion_stream(motion(x))
+
+    def optimize_for_inference(self):
+        """ Return a copy for inference only, both streams optimized by
+        ``net.st_gcn.Model.optimize_for_inference`` """
+        model = copy.deepcopy(self).eval()
+        model.origin_stream = self.origin_stream.optimize_for_inference()
+        model.motion_stream = self.motion_stream.optimize_for_inference()
+        return model
+
+
+class SinglePassModel(ST_GCN):
+    r"""``Model`` with both streams run in a single pass, as the two groups
+    of the grouped convolutions of ``net.st_gcn.Model``.
+
+    It launches half as many kernels, but on the cpu its grouped
+    convolutions are slower than the two passes of ``Model``, see
+    ``benchmark/bench_twostream.py`` before choosing it. Checkpoints of
+    ``Model`` are converted when loaded.
+
+    Args:
+        Same as ``net.st_gcn.Model``
+
+    Shape:
+        Same as ``Model``
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, groups=2, **kwargs)
+        self._register_load_state_dict_pre_hook(merge_streams)
 
     def forward(self, x):
-        N, C, T, V, M = x.size()
-        m = torch.cat((torch.cuda.FloatTensor(N, C, 1, V, M).zero_(),
-                        x[:, :, 1:-1] - 0.5 * x[:, :, 2:] - 0.5 * x[:, :, :-2],
-                        torch.cuda.FloatTensor(N, C, 1, V, M).zero_()), 2)
+        return super().forward(self.stack(x))
+
+    def extract_feature(self, x):
+        return super().extract_feature(self.stack(x))
+
+    def stack(self, x):
+        """ The input of both streams, the motion is only computed if it was
+        not precomputed """
+        if x.size(1) == 2 * self.in_channels:
+            return x
+        return torch.cat((x, motion(x)), dim=1)
+
+
+def merge_streams(state_dict, prefix, *args):
+    """ Convert the weights of the two sequential streams in `state_dict`
+    to the groups of the single pass model, in place """
+    origin = prefix + STREAMS[0]
+    if origin + 'A' not in state_dict:
+        return
+    V = state_dict[origin + 'A'].size(1)
+    for key in [k for k in state_dict if k.startswith(origin)]:
+        name = key[len(origin):]
+        pair = [state_dict.pop(prefix + stream + name) for stream in STREAMS]
+        if name == 'A' or name.endswith('num_batches_tracked'):
+            value = pair[0]
+        elif name.startswith('data_bn.'):
+            # channel v * C + c of every stream -> v * 2C + g * C + c
+            value = torch.stack([p.view(V, -1) for p in pair], dim=1).flatten()
+        elif name.startswith('edge_importance.'):
+            value = torch.stack(pair)
+        else:
+            # per output channel, the groups are consecutive blocks
+            value = torch.cat(pair)
+        state_dict[prefix + name] = value
+
 
-        res = self.origin_stream(x) + self.motion_stream(m)
-        return res
\ No newline at end of file
+def split_streams(state_dict, prefix, *args):
+    """ Convert the weights of the single pass model in `state_dict` to the
+    two sequential streams, in place, the inverse of `merge_streams` """
+    if prefix + 'A' not in state_dict:
+        return
+    V = state_dict[prefix + 'A'].size(1)
+    for key in [k for k in state_dict if k.startswith(prefix)]:
+        name = key[len(prefix):]
+        value = state_dict.pop(key)
+        if name == 'A' or name.endswith('num_batches_tracked'):
+            pair = [value, value]
+        elif name.startswith('data_bn.'):
+            pair = [value.view(V, 2, -1)[:, g].flatten() for g in range(2)]
+        elif name.startswith('edge_importance.'):
+            pair = list(value)
+        else:
+            pair = value.chunk(2)
+        for stream, v in zip(STREAMS, pair):
+            state_dict[prefix + stream + name] = v.clone()
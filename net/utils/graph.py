@@ -16,6 +16,12 @@ class Graph():
             refer to https://github.com/CMU-Perceptual-Computing-Lab/openpose#output
         - ntu-rgb+d: Is consists of 25 joints. For more information, please
             refer to https://github.com/shahroudy/NTURGB-D
+        - body25: Is consists of 25 joints of the openpose BODY_25 model. For
+            more information, please refer to
+            https://github.com/CMU-Perceptual-Computing-Lab/openpose/blob/master/doc/02_output.md
+        - body25_lower_limb: Is consists of the 7 lower limb joints (8 ~ 14) of
+            BODY_25, re-indexed from 0: mid hip, right hip, knee, ankle,
+            left hip, knee, ankle
 
         max_hop (int): the maximal distance between two connected nodes
         dilation (int): controls the spacing between the kernel points
@@ -70,6 +76,22 @@ class Graph():
             neighbor_link = [(i - 1, j - 1) for (i, j) in neighbor_1base]
             self.edge = self_link + neighbor_link
             self.center = 2
+        elif layout == 'body25':
+            self.num_node = 25
+            self_link = [(i, i) for i in range(self.num_node)]
+            neighbor_link = [(1, 8), (1, 2), (1, 5), (2, 3), (3, 4), (5, 6),
+                             (6, 7), (8, 9), (9, 10), (10, 11), (8, 12),
+                             (12, 13), (13, 14), (1, 0), (0, 15), (15, 17),
+                             (0, 16), (16, 18), (14, 19), (19, 20), (14, 21),
+                             (11, 22), (22, 23), (11, 24)]
+            self.edge = self_link + neighbor_link
+            self.center = 1
+        elif layout == 'body25_lower_limb':
+            self.num_node = 7
+            self_link = [(i, i) for i in range(self.num_node)]
+            neighbor_link = [(0, 1), (1, 2), (2, 3), (0, 4), (4, 5), (5, 6)]
+            self.edge = self_link + neighbor_link
+            self.center = 0
         # elif layout=='customer settings'
         #     pass
         else:
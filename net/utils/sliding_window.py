@@ -0,0 +1,65 @@
+import torch
+import torch.nn.functional as F
+
+
+def window_starts(length, window_size, stride):
+    """ The first frame of every window, the last window ends on the last
+    frame so the whole sequence is covered """
+    if length <= window_size:
+        return [0]
+    starts = list(range(0, length - window_size + 1, stride))
+    if starts[-1] + window_size < length:
+        starts.append(length - window_size)
+    return starts
+
+
+def sliding_window_inference(model, data, window_size=300, stride=150,
+                             batch_size=16, aggregate='mean', length=None):
+    r"""Classify a recording of any length from overlapping windows.
+
+    Args:
+        model (nn.Module): Model taking :math:`(N, C, T, V, M)` inputs
+        data (Tensor): One recording in :math:`(C, T, V, M)` format, it can
+            stay on the cpu, only one batch of windows is moved to the model
+        window_size (int): Number of frames of a window
+        stride (int): Number of frames between the starts of two windows
+        batch_size (int): Number of windows per forward pass, this bounds
+            the peak memory independently of the recording length
+        aggregate (str): ``'mean'`` averages the class probabilities of the
+            windows, ``'vote'`` takes the fraction of windows predicting each
+            class, ties broken by the mean probability
+        length (int, optional): Number of recorded frames, by default the
+            sequence without its trailing all-zero frames
+
+    Returns:
+        (Tensor, Tensor): the aggregated score of shape :math:`(num\_class)`
+        and the probabilities of every window, :math:`(num\_window, num\_class)`
+    """
+    if aggregate not in ('mean', 'vote'):
+        raise ValueError('Unknown aggregate: {}'.format(aggregate))
+    data = torch.as_tensor(data)
+    if length is None:
+        valid = (data != 0).flatten(2).any(dim=2).any(dim=0).nonzero()
+        length = valid[-1].item() + 1 if len(valid) else data.size(1)
+    starts = window_starts(length, window_size, stride)
+    size = min(window_size, length)
+
+    device = next(model.parameters()).device
+    training = model.training
+    model.eval()
+    window_score = []
+    with torch.no_grad():
+        for begin in range(0, len(starts), batch_size):
+            batch = torch.stack([data[:, s:s + size]
+                                 for s in starts[begin:begin + batch_size]])
+            output = model(batch.float().to(device))
+            window_score.append(F.softmax(output, dim=1).cpu())
+    model.train(training)
+
+    window_score = torch.cat(window_score)
+    score = window_score.mean(dim=0)
+    if aggregate == 'vote':
+        vote = torch.bincount(window_score.argmax(dim=1),
+                              minlength=window_score.size(1)).float()
+        score = (vote + score) / len(window_score)
+    return score, window_score
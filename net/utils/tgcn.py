@@ -19,15 +19,19 @@ class ConvTemporalGraphical(nn.Module):
             Default: 1
         bias (bool, optional): If ``True``, adds a learnable bias to the output.
             Default: ``True``
+        groups (int, optional): Number of independent groups of channels, each
+            with its own weights and adjacency matrix. Default: 1
 
     Shape:
         - Input[0]: Input graph sequence in :math:`(N, in_channels, T_{in}, V)` format
-        - Input[1]: Input graph adjacency matrix in :math:`(K, V, V)` format
+        - Input[1]: Input graph adjacency matrix in :math:`(K, V, V)` format,
+          or :math:`(G, K, V, V)` for one matrix per group
         - Output[0]: Outpu graph sequence in :math:`(N, out_channels, T_{out}, V)` format
         - Output[1]: Graph adjacency matrix for output data in :math:`(K, V, V)` format
 
         where
             :math:`N` is a batch size,
+            :math:`G` is the number of groups,
             :math:`K` is the spatial kernel size, as :math:`K == kernel_size[1]`,
             :math:`T_{in}/T_{out}` is a length of input/output sequence,
             :math:`V` is the number of graph nodes. 
@@ -41,10 +45,12 @@ class ConvTemporalGraphical(nn.Module):
                  t_stride=1,
                  t_padding=0,
                  t_dilation=1,
-                 bias=True):
+                 bias=True,
+                 groups=1):
         super().__init__()
 
         self.kernel_size = kernel_size
+        self.groups = groups
         self.conv = nn.Conv2d(
             in_channels,
             out_channels * kernel_size,
@@ -52,15 +58,80 @@ class ConvTemporalGraphical(nn.Module):
             padding=(t_padding, 0),
             stride=(t_stride, 1),
             dilation=(t_dilation, 1),
+            groups=groups,
             bias=bias)
+        # a pointwise convolution of several groups runs as one batched
+        # matmul, which is faster than a grouped convolution on the cpu
+        self.batched = (groups > 1 and t_kernel_size == 1 and t_stride == 1
+                        and t_padding == 0)
+        # bias added after the graph aggregation, set by `fold`
+        self.register_buffer('graph_bias', None)
+
+    def fold(self, A, scale, shift, input_shift=None):
+        r"""Fold a per channel affine of the output into the convolution, for
+        inference with the fixed adjacency ``A``.
+
+        Args:
+            A (Tensor): The adjacency matrix in :math:`(K, V, V)` or
+                :math:`(G, K, V, V)` format
+            scale (Tensor): Scale of every output channel
+            shift (Tensor): Shift of every output channel
+            input_shift (Tensor, optional): A shift of the input in
+                :math:`(in_channels, V)` format, folded as well
+
+        The shifts and the convolution bias become a bias of every output
+        channel and node, added before the matmuls of the aggregation.
+        """
+        assert self.conv.kernel_size[0] == 1 and self.conv.padding[0] == 0
+        G, K = self.groups, self.kernel_size
+        v, w = A.size()[-2:]
+        A = A.expand(G, K, v, w)
+        weight = self.conv.weight.view(G, K, -1, self.conv.in_channels // G)
+        if self.conv.bias is None:
+            bias = weight.new_zeros(G, K, weight.size(2), v)
+        else:
+            bias = self.conv.bias.view(G, K, -1, 1).expand(-1, -1, -1, v)
+        if input_shift is not None:
+            bias = bias + torch.einsum('gkoc,gcv->gkov', (weight, input_shift.view(G, -1, v)))
+        graph_bias = torch.einsum('gkov,gkvw->gow', (bias, A)).reshape(-1, w)
+        if self.graph_bias is not None:
+            graph_bias = graph_bias + self.graph_bias.view(-1, w)
+
+        weight = weight * scale.view(G, 1, -1, 1)
+        self.conv.weight = nn.Parameter(weight.view_as(self.conv.weight))
+        self.conv.bias = None
+        self.graph_bias = (graph_bias * scale.view(-1, 1) + shift.view(-1, 1)).view(-1, 1, w)
 
     def forward(self, x, A):
-        assert A.size(0) == self.kernel_size
+        assert A.size(-3) == self.kernel_size
 
-        x = self.conv(x)
+        if self.batched:
+            n, _, t, v = x.size()
+            weight = self.conv.weight.view(self.groups, -1, self.conv.in_channels // self.groups)
+            x = torch.matmul(weight, x.reshape(n, self.groups, -1, t * v)).view(n, -1, t, v)
+            if self.conv.bias is not None:
+                x.add_(self.conv.bias.view(-1, 1, 1))
+        else:
+            x = self.conv(x)
 
-        n, kc, t, v = x.size()
-        x = x.view(n, self.kernel_size, kc//self.kernel_size, t, v)
-        x = torch.einsum('nkctv,kvw->nctw', (x, A))
+        # sum_k x_k A_k as K batched matmuls accumulated into one output,
+        # the (c, t) rows of each group and partition are already contiguous
+        # so neither the input nor the result is permuted or copied
+        n, gkc, t, v = x.size()
+        G, K = self.groups, self.kernel_size
+        c, w = gkc // (G * K), A.size(-1)
+        x = x.view(n, G, K, c * t, v)
+        A_ = A.expand(n, G, K, v, w)
+        if self.graph_bias is None:
+            out = torch.bmm(x[:, :, 0].reshape(n * G, c * t, v),
+                            A_[:, :, 0].reshape(n * G, v, w))
+        else:
+            # out of place, the reshape may be a view of the bias buffer
+            out = torch.baddbmm(self.graph_bias.expand(n, G * c, t, w).reshape(n * G, c * t, w),
+                                x[:, :, 0].reshape(n * G, c * t, v),
+                                A_[:, :, 0].reshape(n * G, v, w))
+        for k in range(1, K):
+            out.baddbmm_(x[:, :, k].reshape(n * G, c * t, v),
+                         A_[:, :, k].reshape(n * G, v, w))
 
-        return x.contiguous(), A
+        return out.view(n, G * c, t, w), A
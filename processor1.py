@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # pylint: disable=W0201
 import sys
+import time
 import argparse
 import yaml
 import numpy as np
@@ -16,6 +17,10 @@ import torchlight as torchlight
 import os
 os.environ["KMP_DUPLICATE_LIB_OK"]="TRUE"   # avoid env conflict
 
+from feeder.sampler import BucketBatchSampler, pad_collate
+from feeder.metrics import MetricAccumulator
+from net.utils.sliding_window import sliding_window_inference
+
 import torch.nn.functional as F
 class FocalLoss(nn.Module):
     def __init__(self, alpha=1, gamma=2):
@@ -69,11 +74,20 @@ class Processor():
         self.arg = parser.parse_args(argv)
 
     def load_model(self):
+        # in the test phase the compiled model saved next to the weights is used directly
+        self.compiled = False
+        if self.arg.phase == 'test' and self.arg.weights and self.arg.use_compiled:
+            model = self.io.load_compiled(self.arg.weights, self.input_channels(),
+                                          map_location=self.dev)
+            if model is not None:
+                self.model = model
+                self.compiled = True
+                return
         self.model = self.io.load_model(self.arg.model,
                                         **(self.arg.model_args))
 
     def load_weights(self):
-        if self.arg.weights:
+        if self.arg.weights and not self.compiled:
             self.model = self.io.load_weights(self.model, self.arg.weights,
                                               self.arg.ignore_weights)
 
@@ -86,7 +100,7 @@ class Processor():
                 setattr(self, name, value.to(self.dev))
 
         # model parallel
-        if self.arg.use_gpu and len(self.gpus) > 1:
+        if self.arg.use_gpu and len(self.gpus) > 1 and not self.compiled:
             self.model = nn.DataParallel(self.model, device_ids=self.gpus)
 
 
@@ -120,28 +134,64 @@ class Processor():
                         weight_decay=0.0001)
 
     def load_data(self):
-        # Feeder = import_class(self.arg.feeder)
-        from feeder.feeder import Feeder
-        # if 'debug' not in self.arg.train_feeder_args:
-        #     self.arg.train_feeder_args['debug'] = self.arg.debug
+        Feeder = torchlight.import_class(self.arg.feeder)
+        train_feeder_args = dict(self.arg.train_feeder_args)
+        test_feeder_args = dict(self.arg.test_feeder_args)
+        if not test_feeder_args:
+            # feeder.feeder.Feeder loads the dataset once and splits it into
+            # the train and test phase, the split is kept in work_dir
+            train_feeder_args.setdefault(
+                'split_path', os.path.join(self.arg.work_dir, 'split.json'))
+            dataset = Feeder(**train_feeder_args)
+            train_dataset = dataset.subset('train')
+            test_dataset = dataset.subset('test')
+        else:
+            train_dataset = None
+            if self.arg.phase == 'train':
+                train_dataset = Feeder(**train_feeder_args)
+            test_dataset = Feeder(**test_feeder_args)
+        num_workers = self.arg.num_worker * torchlight.ngpu(self.arg.device)
+
+        # the augmentation of feeder.feeder.Feeder runs at collate time on whole batches
+        augmentation = getattr(train_dataset, 'augmentation', None)
+        train_loader_args = dict()
+        if augmentation is not None:
+            train_loader_args['collate_fn'] = augmentation
+            if augmentation.seed is not None:
+                train_loader_args['generator'] = torch.Generator().manual_seed(augmentation.seed)
+
         self.data_loader = dict()
-        # print(dataset.shape)
-        # train_dataset = dataset[:35]
-        # test_dataset  = dataset[35:]
+        if getattr(test_dataset, 'variable_length', False):
+            # samples keep their true length, every batch is only padded to its own maximum
+            train_loader_args.setdefault('collate_fn', pad_collate)
+            if self.arg.phase == 'train':
+                self.data_loader['train'] = torch.utils.data.DataLoader(
+                    dataset=train_dataset,
+                    batch_sampler=BucketBatchSampler(train_dataset.length,
+                                                     self.arg.batch_size),
+                    num_workers=num_workers,
+                    **train_loader_args)
+            self.data_loader['test'] = torch.utils.data.DataLoader(
+                dataset=test_dataset,
+                batch_size=self.arg.test_batch_size,
+                shuffle=False,
+                collate_fn=pad_collate,
+                num_workers=num_workers)
+            return
+
         if self.arg.phase == 'train':
             self.data_loader['train'] = torch.utils.data.DataLoader(
-                dataset = Feeder(phase='train'),
+                dataset=train_dataset,
                 batch_size=self.arg.batch_size,
                 shuffle=True,
-                num_workers=0,
-                drop_last=False)
-        # if self.arg.test_feeder_args:
+                num_workers=num_workers,
+                drop_last=False,
+                **train_loader_args)
         self.data_loader['test'] = torch.utils.data.DataLoader(
-            dataset = Feeder(phase='test'),
+            dataset=test_dataset,
             batch_size=self.arg.test_batch_size,
             shuffle=False,
-            num_workers=self.arg.num_worker * torchlight.ngpu(
-                self.arg.device))
+            num_workers=num_workers)
 
     def show_epoch_info(self):
         for k, v in self.epoch_info.items():
@@ -173,6 +223,8 @@ class Processor():
 
     def train(self):
         # print(len(self.data_loader['train']))
+        start_time = time.time()
+        num_sample = 0
         for batch_idx, (data, label) in enumerate(self.data_loader['train']):
             # get data
             data = data.float().to(self.dev)
@@ -191,12 +243,26 @@ class Processor():
             self.optimizer.zero_grad()
             loss.backward()
             self.optimizer.step()
+            num_sample += label.size(0)
+
+        # throughput and, for length bucketed batches, the padding waste
+        elapsed = max(time.time() - start_time, 1e-6)
+        self.epoch_info['samples/s'] = '{:.2f}'.format(num_sample / elapsed)
+        sampler = self.data_loader['train'].batch_sampler
+        if isinstance(sampler, BucketBatchSampler):
+            self.epoch_info['frames/s'] = '{:.1f}'.format(
+                sampler.stats['num_frame'] / elapsed)
+            self.epoch_info['padding waste'] = '{:.2%}'.format(
+                sampler.padding_waste())
+        self.show_epoch_info()
 
     def test(self):
         # print(len(self.data_loader['train']))
+        metric = MetricAccumulator(self.arg.model_args['num_class'])
+        if self.arg.window_size > 0:
+            self.test_sliding_window(metric)
+            return
         with torch.no_grad():
-            total_correct = 0
-            total_samples = 0
             for batch_idx, (data, label) in enumerate(self.data_loader['test']):
                 # get data
                 data = data.float().to(self.dev)
@@ -209,11 +275,28 @@ class Processor():
                 #     self.train_writer.add_graph(self.model, output)
                 print(f"label={label}, predicted label={predict_label}")
                 # loss = self.loss_CE(output, label)
-                correct = (predict_label == label).sum().item()
-                total_correct += correct
-                total_samples += label.size(0)
-            accuracy = total_correct / total_samples * 100
-            print(f'Accuracy: {accuracy:.2f}%')
+                metric.update(output, label)
+        self.show_metric(metric)
+
+    def test_sliding_window(self, metric):
+        # every recording is classified from overlapping windows of its true length,
+        # only `window_batch_size` windows are on the device at once
+        dataset = self.data_loader['test'].dataset
+        for i in range(len(dataset)):
+            data, label = dataset[i]
+            score, window_score = sliding_window_inference(
+                self.model, data, self.arg.window_size, self.arg.window_stride,
+                self.arg.window_batch_size, self.arg.window_aggregate)
+            print(f"label={label}, predicted label={score.argmax().item()}, windows={len(window_score)}")
+            metric.update(score[None], [label])
+        self.show_metric(metric)
+
+    def show_metric(self, metric):
+        print(f'Accuracy: {metric.accuracy() * 100:.2f}%')
+        print('Precision: {}'.format(np.round(metric.precision(), 4).tolist()))
+        print('Recall: {}'.format(np.round(metric.recall(), 4).tolist()))
+        print(f'Macro-F1: {metric.macro_f1():.4f}')
+        print(f'Quadratic weighted kappa: {metric.kappa():.4f}')
 
     def start(self):
         self.io.print_log('Parameters:\n{}\n'.format(str(vars(self.arg))))
@@ -236,6 +319,8 @@ class Processor():
                         epoch + 1 == self.arg.num_epoch):
                     filename = 'epoch{}_model.pt'.format(epoch + 1)
                     self.io.save_model(self.model, filename)
+                    if self.arg.save_compiled:
+                        self.io.save_compiled(self.model, self.example_input(), filename)
 
                 # evaluation
                 if ((epoch + 1) % self.arg.eval_interval == 0) or (
@@ -264,6 +349,28 @@ class Processor():
                         self.result))
                 self.io.save_pkl(result_dict, 'test_result.pkl')
 
+        # export the compiled model of the weights next to them
+        elif self.arg.phase == 'export':
+            if self.arg.weights is None:
+                raise ValueError('Please appoint --weights.')
+            path = torchlight.compiled_path(self.arg.weights)
+            torchlight.export_model(self.model, self.example_input(), path)
+            self.io.print_log('The compiled model has been saved as {}.'.format(path))
+
+    def input_channels(self):
+        # the channels of the test samples, feeder.feeder.Feeder with motion
+        # stacks the motion after the positions
+        in_channels = self.arg.model_args.get('in_channels')
+        feeder_args = self.arg.test_feeder_args or self.arg.train_feeder_args
+        if in_channels is not None and feeder_args.get('motion'):
+            in_channels *= 2
+        return in_channels
+
+    def example_input(self):
+        # one test sample as a batch, the input the model is traced on
+        data, _ = self.data_loader['test'].dataset[0]
+        return torch.as_tensor(data).float()[None]
+
     # @staticmethod
     def get_parser(add_help=False):
 
@@ -275,7 +382,7 @@ class Processor():
         parser.add_argument('-c', '--config', default="./config/cfg.yaml", help='path to the configuration file')
 
         # processor
-        parser.add_argument('--phase', default='train', help='must be train or test')
+        parser.add_argument('--phase', default='train', help='must be train, test or export')
         parser.add_argument('--save_result', type=str2bool, default=False, help='if ture, the output of the model will be stored')
         parser.add_argument('--start_epoch', type=int, default=0, help='start training from which epoch')
         parser.add_argument('--num_epoch', type=int, default=80, help='stop training in which epoch')
@@ -291,7 +398,7 @@ class Processor():
         parser.add_argument('--pavi_log', type=str2bool, default=False, help='logging on pavi or not')
 
         # feeder
-        parser.add_argument('--feeder', default='feeder.feeder', help='data loader will be used')
+        parser.add_argument('--feeder', default='feeder.feeder.Feeder', help='data loader will be used')
         parser.add_argument('--num_worker', type=int, default=4, help='the number of worker per gpu for data loader')
         parser.add_argument('--train_feeder_args', default=dict(), help='the arguments of data loader for training')
         parser.add_argument('--test_feeder_args', default=dict(), help='the arguments of data loader for test')
@@ -299,11 +406,19 @@ class Processor():
         parser.add_argument('--test_batch_size', type=int, default=256, help='test batch size')
         parser.add_argument('--debug', action="store_true", help='less data, faster loading')
 
+        # sliding window inference
+        parser.add_argument('--window_size', type=int, default=-1, help='if positive, test every recording from overlapping windows of this many frames')
+        parser.add_argument('--window_stride', type=int, default=150, help='the number of frames between the starts of two windows')
+        parser.add_argument('--window_batch_size', type=int, default=16, help='the number of windows per forward pass')
+        parser.add_argument('--window_aggregate', default='mean', help='mean or vote, how the windows of a recording are aggregated')
+
         # model
         parser.add_argument('--model', default=None, help='the model will be used')
         parser.add_argument('--model_args', default=dict(), help='the arguments of model')
         parser.add_argument('--weights', default=None, help='the weights for network initialization')
         parser.add_argument('--ignore_weights', type=str, default=[], nargs='+', help='the name of weights which will be ignored in the initialization')
+        parser.add_argument('--save_compiled', type=str2bool, default=False, help='if true, a TorchScript model is saved next to every checkpoint')
+        parser.add_argument('--use_compiled', type=str2bool, default=True, help='if true, the test phase runs the TorchScript model saved next to the weights when it exists')
         #endregion yapf: enable
 
         parser.add_argument('--weight_decay', default=0.0001)
@@ -3,6 +3,9 @@ from .io import str2bool
 from .io import str2dict
 from .io import DictAction
 from .io import import_class
+from .io import save_h5
+from .io import compiled_path
+from .io import export_model
 from .gpu import visible_gpu
 from .gpu import occupy_gpu
 from .gpu import ngpu
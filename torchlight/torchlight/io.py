@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import argparse
+import copy
 import os
 import sys
 import traceback
@@ -93,10 +94,8 @@ class IO():
         with open('{}/{}'.format(self.work_dir, filename), 'wb') as f:
             pickle.dump(result, f)
 
-    def save_h5(self, result, filename):
-        with h5py.File('{}/{}'.format(self.work_dir, filename), 'w') as f:
-            for k in result.keys():
-                f[k] = result[k]
+    def save_h5(self, result, filename, **kwargs):
+        save_h5('{}/{}'.format(self.work_dir, filename), result, **kwargs)
 
     def save_model(self, model, name):
         model_path = '{}/{}'.format(self.work_dir, name)
@@ -106,6 +105,30 @@ class IO():
         torch.save(weights, model_path)
         self.print_log('The model has been saved as {}.'.format(model_path))
 
+    def save_compiled(self, model, example, name):
+        path = '{}/{}'.format(self.work_dir, compiled_path(name))
+        export_model(model, example, path)
+        self.print_log('The compiled model has been saved as {}.'.format(path))
+
+    def load_compiled(self, weights_path, in_channels=None, map_location=None):
+        """ Return the compiled model saved next to the weights, None if
+        there is none, it is older than the weights or it was traced on
+        inputs of other than `in_channels` channels """
+        path = compiled_path(weights_path)
+        if not os.path.exists(path) or \
+                os.path.getmtime(path) < os.path.getmtime(weights_path):
+            return None
+        extra_files = {'input_channels': ''}
+        model = torch.jit.load(path, map_location=map_location, _extra_files=extra_files)
+        traced_channels = extra_files['input_channels']
+        traced_channels = int(traced_channels) if traced_channels else None
+        if in_channels is not None and traced_channels != in_channels:
+            self.print_log('The compiled model {} was traced on {} input channels, '
+                           'not {}, it is not used.'.format(path, traced_channels, in_channels))
+            return None
+        self.print_log('Load compiled model from {}.'.format(path))
+        return model
+
     def save_arg(self, arg):
 
         self.session_file = '{}/config.yaml'.format(self.work_dir)
@@ -157,6 +180,51 @@ class IO():
                 )
 
 
+def save_h5(path, result, attrs=None, chunks=None, compression=None):
+    """ Write every array of `result` as a dataset of the h5 file `path`,
+    keys may contain '/' to nest them in groups
+    attrs: {key: {name: value}} attributes of each dataset, '/' for the file
+    chunks: the chunk shape of every dataset, or {key: chunk shape}
+    compression: e.g. 'gzip', only applied to chunked datasets
+    """
+    if attrs is None:
+        attrs = dict()
+    with h5py.File(path, 'w') as f:
+        for k in result.keys():
+            chunk = chunks.get(k) if isinstance(chunks, dict) else chunks
+            if chunk is None:
+                f[k] = result[k]
+            else:
+                f.create_dataset(k, data=result[k], chunks=chunk,
+                                 compression=compression, shuffle=compression is not None)
+        for k, v in attrs.items():
+            f[k].attrs.update(v)
+
+
+def compiled_path(weights_path):
+    """ The path of the compiled model of a checkpoint, e.g.
+    epoch10_model.pt -> epoch10_model.jit.pt """
+    return os.path.splitext(weights_path)[0] + '.jit.pt'
+
+
+def export_model(model, example, path):
+    """ Trace the model in eval mode on `example`, a batch of inputs, and
+    save it as TorchScript. The model is first replaced by the copy returned
+    by its `optimize_for_inference` if it has one. The trace keeps the batch
+    size and the sequence length of its inputs free, but not their channels,
+    the channel count of `example` is saved with it as `input_channels`. """
+    model = getattr(model, 'module', model)
+    if hasattr(model, 'optimize_for_inference'):
+        model = model.optimize_for_inference()
+    else:
+        model = copy.deepcopy(model).eval()
+    example = example.to(next(model.parameters()).device)
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.filterwarnings('ignore', category=torch.jit.TracerWarning)
+        compiled = torch.jit.trace(model, example)
+    compiled.save(path, _extra_files={'input_channels': str(example.size(1))})
+
+
 def str2bool(v):
     if v.lower() in ('yes', 'true', 't', 'y', '1'):
         return True